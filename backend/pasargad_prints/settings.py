@@ -164,8 +164,7 @@ MIDDLEWARE = [
     'utils.middleware.RequestLoggingMiddleware',  # Includes performance monitoring
     'utils.middleware.CacheMiddleware',  # API caching
     # 'utils.goshippo_middleware.GoshippoAuthenticationMiddleware',  # Goshippo authentication - disabled
-    # 'utils.goshippo_middleware.GoshippoRequestProcessingMiddleware',  # Goshippo request processing - disabled
-    # 'utils.goshippo_middleware.GoshippoResponseProcessingMiddleware',  # Goshippo response processing - disabled
+    # 'utils.goshippo_middleware.GoshippoRequestProcessingMiddleware',  # Goshippo request/response processing - disabled
     # Removed redundant middleware:
     # - SecurityHeadersMiddleware (Django's SecurityMiddleware handles this)
     # - PerformanceMonitoringMiddleware (consolidated into RequestLoggingMiddleware)
@@ -487,6 +486,10 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@pasargadprints.com')
+# Emails per second each sender address may hand to the SMTP server. Off
+# (0) unless a deployment sets it; emails over the limit are queued for
+# process_email_queue instead of being sent and throttled by the provider.
+EMAIL_RATE_LIMIT = config('EMAIL_RATE_LIMIT', default=0, cast=int)
 
 # Stripe settings
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
@@ -656,6 +659,10 @@ LOGGING = {
     },
 }
 
+# Write log records from background threads so requests only enqueue them
+# (see utils.log_queue)
+LOGGING_QUEUE = config('LOGGING_QUEUE', default=True, cast=bool)
+
 # Create logs directory if it doesn't exist
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
 if not os.path.exists(LOG_DIR):
@@ -666,14 +673,22 @@ if not os.path.exists(LOG_DIR):
 # In production, this should be configured to use Redis
 USE_REDIS_CACHE = config('USE_REDIS_CACHE', default=False, cast=bool)
 
+# Seconds hot keys are also kept in a per-process memory cache in front of
+# the shared backend (0 disables it). Invalidations only clear the local copy
+# in the process that issued them, so keep this short.
+L1_CACHE_TTL = config('L1_CACHE_TTL', default=0, cast=int)
+
 if USE_REDIS_CACHE:
     # Production Redis configuration - Simplified to single cache backend
+    # Both aliases share the msgpack serializer so any key can be read or
+    # invalidated from either side without a format mismatch
     CACHES = {
         'default': {
             'BACKEND': 'django_redis.cache.RedisCache',
             'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
             'OPTIONS': {
                 'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'SERIALIZER': 'utils.cache_serializers.MSGPackSerializer',
                 'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
                 'CONNECTION_POOL_CLASS_KWARGS': {
                     'max_connections': 50,
@@ -692,6 +707,7 @@ if USE_REDIS_CACHE:
             'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/2'),
             'OPTIONS': {
                 'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'SERIALIZER': 'utils.cache_serializers.MSGPackSerializer',
                 'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
                 'CONNECTION_POOL_CLASS_KWARGS': {
                     'max_connections': 50,
@@ -756,6 +772,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'utils.tasks.cleanup_expired_sessions',
         'schedule': 86400.0,  # Every day
     },
+    'process-email-queue': {
+        'task': 'utils.tasks.process_email_queue',
+        'schedule': 60.0,  # Every minute
+    },
     'process-abandoned-carts': {
         'task': 'cart.tasks.process_abandoned_carts',
         'schedule': 86400.0,  # Every day
@@ -408,4 +408,121 @@ class PaymentHelpersTestCase(TestCase):
         _handle_successful_payment(session)
         
         self.assertEqual(Order.objects.count(), 1)
-        self.assertEqual(Payment.objects.count(), 1)
\ No newline at end of file
+        self.assertEqual(Payment.objects.count(), 1)
+
+class CheckoutOrderCreationTestCase(TestCase):
+    """Order creation from a completed checkout session (bulk item insert and stock update)"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer',
+            email='buyer@example.com',
+            password='testpass123'
+        )
+        # Run the product signal's on-commit invalidation now, so it does not
+        # absorb the one registered by checkout
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name='Figures')
+            self.dragon = Product.objects.create(
+                name='Dragon',
+                description='Articulated dragon',
+                price=Decimal('12.50'),
+                category=self.category,
+                sku='DRG-1',
+                stock_quantity=10,
+                weight=Decimal('80.00'),
+                dimensions='20 x 5 x 5',
+                print_time=240
+            )
+            self.vase = Product.objects.create(
+                name='Vase',
+                description='Spiral vase',
+                price=Decimal('30.00'),
+                category=self.category,
+                sku='VAS-1',
+                stock_quantity=4,
+                weight=Decimal('150.00'),
+                dimensions='10 x 10 x 25',
+                print_time=300
+            )
+        
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.dragon, quantity=3)
+        CartItem.objects.create(cart=self.cart, product=self.vase, quantity=2)
+        
+        self.session = {
+            'id': 'cs_test_bulk',
+            'payment_intent': 'pi_test_bulk',
+            'customer': 'cus_test',
+            'currency': 'usd',
+            'amount_subtotal': 9750,
+            'amount_total': 10530,
+            'total_details': {'amount_tax': 780, 'amount_shipping': 0},
+            'metadata': {'cart_id': str(self.cart.id), 'user_id': str(self.user.id)},
+            'customer_details': {'name': 'Buyer', 'email': 'buyer@example.com'},
+            'shipping_details': {
+                'name': 'Buyer',
+                'address': {
+                    'line1': '1 Main St',
+                    'city': 'Springfield',
+                    'state': 'IL',
+                    'postal_code': '62701',
+                    'country': 'US',
+                },
+            },
+        }
+    
+    @patch('payments.views.email_service')
+    def test_creates_order_items_and_updates_stock(self, mock_email):
+        from payments.views import _handle_successful_payment
+        
+        _handle_successful_payment(self.session)
+        
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.subtotal, Decimal('97.50'))
+        self.assertEqual(order.tax_amount, Decimal('7.80'))
+        self.assertEqual(order.total_amount, Decimal('105.30'))
+        
+        items = {item.product_sku: item for item in order.items.all()}
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items['DRG-1'].quantity, 3)
+        self.assertEqual(items['DRG-1'].unit_price, Decimal('12.50'))
+        self.assertEqual(items['DRG-1'].total_price, Decimal('37.50'))
+        self.assertEqual(items['DRG-1'].product_name, 'Dragon')
+        self.assertEqual(items['DRG-1'].product_weight, Decimal('80.00'))
+        self.assertEqual(items['VAS-1'].total_price, Decimal('60.00'))
+        
+        self.dragon.refresh_from_db()
+        self.vase.refresh_from_db()
+        self.assertEqual(self.dragon.stock_quantity, 7)
+        self.assertEqual(self.vase.stock_quantity, 2)
+        
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(Payment.objects.get(order=order).amount, Decimal('105.30'))
+        mock_email.send_order_confirmation.assert_called_once_with(order)
+    
+    @patch('payments.views.email_service')
+    def test_repeated_session_updates_stock_once(self, mock_email):
+        from payments.views import _handle_successful_payment
+        
+        _handle_successful_payment(self.session)
+        _handle_successful_payment(self.session)
+        
+        self.assertEqual(Order.objects.count(), 1)
+        self.dragon.refresh_from_db()
+        self.assertEqual(self.dragon.stock_quantity, 7)
+    
+    @patch('payments.views.email_service')
+    def test_product_caches_cleared_on_commit(self, mock_email):
+        from django.core.cache import cache
+        from payments.views import _handle_successful_payment
+        from utils.cache import CacheKeys
+        
+        detail_key = CacheKeys.product_detail(self.dragon.id)
+        cache.set(detail_key, 'cached')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            _handle_successful_payment(self.session)
+            self.assertEqual(cache.get(detail_key), 'cached')
+        
+        self.assertIsNone(cache.get(detail_key))
@@ -15,6 +15,7 @@ from rest_framework.response import Response
 from cart.models import Cart
 from orders.models import Order, OrderItem
 from products.models import Product
+from products.signals import invalidate_products_cache
 from .models import Payment, StripeWebhookEvent
 from .stripe_init import stripe
 
@@ -48,7 +49,7 @@ def create_checkout_session(request):
             return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Validate stock availability before creating checkout session
-        for item in cart.items.all():
+        for item in cart.items.select_related('product'):
             if not item.product.is_in_stock or item.product.stock_quantity == 0:
                 return Response({
                     'error': f'{item.product.name} is out of stock. Please remove it from your cart.'
@@ -383,16 +384,30 @@ def _create_order_from_session(session, cart):
 
     logger.info(f"Created order {order.order_number} in memory.")
 
-    for cart_item in cart.items.all():
-        OrderItem.objects.create(
+    # bulk_create bypasses OrderItem.save(), so fill in the product snapshot
+    # and totals here.
+    order_items = []
+    products = []
+    for cart_item in cart.items.select_related('product'):
+        product = cart_item.product
+        order_items.append(OrderItem(
             order=order,
-            product=cart_item.product,
+            product=product,
             quantity=cart_item.quantity,
-            unit_price=cart_item.product.price,
-        )
-        product = cart_item.product
+            unit_price=product.price,
+            total_price=product.price * cart_item.quantity,
+            product_name=product.name,
+            product_sku=product.sku,
+            product_weight=product.weight,
+        ))
         product.stock_quantity -= cart_item.quantity
-        product.save(update_fields=['stock_quantity'])
+        products.append(product)
+    OrderItem.objects.bulk_create(order_items)
+    Product.objects.bulk_update(products, ['stock_quantity'])
+    
+    # bulk_update does not send post_save, so clear what the product signal
+    # handler would have, once the checkout transaction commits
+    invalidate_products_cache(products)
 
     return order
 
@@ -424,7 +439,7 @@ def _create_payment_record(session, order):
 def _prepare_line_items(cart, request):
     """Prepares a list of line items for the Stripe session."""
     line_items = []
-    for item in cart.items.all():
+    for item in cart.items.select_related('product'):
         product_data = {'name': item.product.name}
         if item.product.description:
             product_data['description'] = item.product.description[:500]
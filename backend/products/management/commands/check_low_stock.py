@@ -29,45 +29,45 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         
-        # Get low stock products
+        # Get low stock products as plain tuples of the columns the alert uses
         low_stock_products = Product.objects.filter(
             is_active=True,
             stock_quantity__gt=0,
             stock_quantity__lte=F('low_stock_threshold')
-        ).order_by('stock_quantity')
+        ).order_by('stock_quantity').values_list(
+            'name', 'sku', 'stock_quantity', 'low_stock_threshold'
+        )
         
         out_of_stock_products = Product.objects.filter(
             is_active=True,
             stock_quantity=0
-        ).order_by('name')
-        
-        if not low_stock_products.exists() and not out_of_stock_products.exists():
-            self.stdout.write(self.style.SUCCESS('No stock alerts needed.'))
-            return
+        ).order_by('name').values_list('name', 'sku')
         
         # Prepare alert data
         alert_data = {
-            'low_stock_products': [],
-            'out_of_stock_products': []
+            'low_stock_products': [
+                {
+                    'name': name,
+                    'sku': sku,
+                    'current_stock': stock_quantity,
+                    'threshold': low_stock_threshold
+                }
+                for name, sku, stock_quantity, low_stock_threshold
+                in low_stock_products.iterator(chunk_size=1000)
+            ],
+            'out_of_stock_products': [
+                {'name': name, 'sku': sku}
+                for name, sku in out_of_stock_products.iterator(chunk_size=1000)
+            ]
         }
         
-        for product in low_stock_products:
-            alert_data['low_stock_products'].append({
-                'name': product.name,
-                'sku': product.sku,
-                'current_stock': product.stock_quantity,
-                'threshold': product.low_stock_threshold
-            })
-        
-        for product in out_of_stock_products:
-            alert_data['out_of_stock_products'].append({
-                'name': product.name,
-                'sku': product.sku
-            })
+        if not alert_data['low_stock_products'] and not alert_data['out_of_stock_products']:
+            self.stdout.write(self.style.SUCCESS('No stock alerts needed.'))
+            return
         
         # Log the alerts
-        self.stdout.write(self.style.WARNING(f'Found {low_stock_products.count()} low stock products'))
-        self.stdout.write(self.style.WARNING(f'Found {out_of_stock_products.count()} out of stock products'))
+        self.stdout.write(self.style.WARNING(f"Found {len(alert_data['low_stock_products'])} low stock products"))
+        self.stdout.write(self.style.WARNING(f"Found {len(alert_data['out_of_stock_products'])} out of stock products"))
         
         if dry_run:
             self.stdout.write(self.style.SUCCESS('Dry run - no emails sent'))
@@ -3,35 +3,47 @@ from django.dispatch import receiver
 from django.core.cache import cache
 from .models import Product, Category, ProductImage, ProductReview
 from .tasks import update_product_search_vectors, process_product_image
-from utils.cache import invalidate_product_cache, invalidate_cache
+from utils.cache import CacheKeys, invalidate_product_cache, invalidate_cache, invalidate_cache_on_commit
 import logging
 
 logger = logging.getLogger(__name__)
 
-@receiver([post_save, post_delete], sender=Product)
-def invalidate_product_caches(sender, instance, **kwargs):
-    """Invalidate caches when product is saved or deleted"""
-    # Invalidate specific product cache
-    cache_keys = [
-        f'product:{instance.id}',
-        f'product:{instance.id}:*',
-        'product_list:*',
-    ]
+def invalidate_products_cache(products, created=False):
+    """
+    Invalidate the caches of changed products once the transaction commits
     
-    if instance.category_id:
-        cache_keys.append(f'category:{instance.category_id}:products')
+    Used by the post_save/post_delete handler and by bulk writes, which send
+    no signals (e.g. the stock bulk_update at checkout).
+    """
+    cache_keys = ['product_list:*']
+    update_search_vectors = created
+    for product in products:
+        product_key = CacheKeys.product_detail(product.id)
+        cache_keys.append(product_key)
+        cache_keys.append(product_key + ':*')
+        
+        if product.category_id:
+            cache_keys.append(CacheKeys.category_products(product.category_id))
+        
+        if not product.search_vector:
+            update_search_vectors = True
     
-    invalidate_cache(cache_keys)
+    # Coalesced per transaction, so bulk product writes invalidate once
+    invalidate_cache_on_commit(cache_keys)
     
     # Update search vector asynchronously (only if Celery is available)
-    if kwargs.get('created', False) or not instance.search_vector:
+    if update_search_vectors:
         try:
             from django.conf import settings
             if getattr(settings, 'USE_REDIS_CACHE', False):
                 update_product_search_vectors.delay()
         except Exception as e:
             logger.warning(f"Could not queue search vector update task: {e}")
-    
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_caches(sender, instance, **kwargs):
+    """Invalidate caches when product is saved or deleted"""
+    invalidate_products_cache([instance], created=kwargs.get('created', False))
     logger.info(f"Invalidated cache for product {instance.id}")
 
 @receiver([post_save, post_delete], sender=Category)
@@ -61,9 +73,10 @@ def process_new_product_image(sender, instance, created, **kwargs):
 def invalidate_review_caches(sender, instance, **kwargs):
     """Invalidate caches when review is saved or deleted"""
     # Invalidate product detail cache (includes reviews)
+    product_key = CacheKeys.product_detail(instance.product_id)
     cache_keys = [
-        f'product:{instance.product_id}',
-        f'product:{instance.product_id}:reviews',
+        product_key,
+        product_key + ':reviews',
     ]
     
     invalidate_cache(cache_keys)
@@ -26,8 +26,8 @@ class CategoryListView(CacheMixin, generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         # Try to get from cache first
         cached_response = self.get_cached_response()
-        if cached_response:
-            return Response(cached_response)
+        if cached_response is not None:
+            return cached_response
         
         # Get fresh data
         response = super().list(request, *args, **kwargs)
@@ -133,7 +133,7 @@ class ProductDetailView(CacheMixin, generics.RetrieveAPIView):
     
     def retrieve(self, request, *args, **kwargs):
         # Try cache first
-        cache_key = f"{CacheKeys.PRODUCT_DETAIL.format(id=kwargs.get('pk'))}"
+        cache_key = CacheKeys.product_detail(kwargs.get('pk'))
         
         def get_data():
             response = super(ProductDetailView, self).retrieve(request, *args, **kwargs)
@@ -12,6 +12,7 @@ import logging
 from datetime import datetime
 from pathlib import Path
 from django.db import transaction
+from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
 
 # Load environment variables from root .env file
@@ -117,17 +118,10 @@ def update_order_statuses():
     from datetime import timedelta
     cutoff_date = datetime.now() - timedelta(days=30)
     
-    old_orders = Order.objects.filter(
+    completed_count = Order.objects.filter(
         created_at__lt=cutoff_date,
         status__in=['shipped', 'delivered']
-    )
-    
-    completed_count = 0
-    for order in old_orders:
-        if order.status in ['shipped', 'delivered']:
-            order.status = 'completed'
-            order.save()
-            completed_count += 1
+    ).update(status='completed', updated_at=timezone.now())
     
     logger.info(f"Marked {completed_count} old orders as completed")
 
@@ -52,7 +52,7 @@ class TrackingEventAdmin(admin.ModelAdmin):
     list_display = ['order', 'tracking_number', 'status', 'status_date', 'location', 'created_at']
     list_filter = ['status', 'status_date', 'created_at']
     search_fields = ['order__order_number', 'tracking_number', 'status_details', 'location']
-    readonly_fields = ['webhook_data', 'created_at']
+    readonly_fields = ['payload', 'created_at']
     
     fieldsets = (
         ('Order Information', {
@@ -62,7 +62,7 @@ class TrackingEventAdmin(admin.ModelAdmin):
             'fields': ('status', 'status_details', 'status_date', 'location')
         }),
         ('Webhook Data', {
-            'fields': ('webhook_data',),
+            'fields': ('payload',),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
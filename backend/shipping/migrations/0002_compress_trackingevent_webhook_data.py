@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+
+def compress_webhook_data(apps, schema_editor):
+    TrackingEvent = apps.get_model('shipping', 'TrackingEvent')
+    for event in TrackingEvent.objects.only('id', 'webhook_data').iterator(chunk_size=500):
+        event.webhook_data_compressed = zlib.compress(
+            json.dumps(event.webhook_data).encode('utf-8'), 3
+        )
+        event.save(update_fields=['webhook_data_compressed'])
+
+
+def decompress_webhook_data(apps, schema_editor):
+    TrackingEvent = apps.get_model('shipping', 'TrackingEvent')
+    for event in TrackingEvent.objects.only('id', 'webhook_data_compressed').iterator(chunk_size=500):
+        data = event.webhook_data_compressed
+        event.webhook_data = json.loads(zlib.decompress(bytes(data))) if data else {}
+        event.save(update_fields=['webhook_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackingevent',
+            name='webhook_data_compressed',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(compress_webhook_data, decompress_webhook_data),
+        migrations.RemoveField(
+            model_name='trackingevent',
+            name='webhook_data',
+        ),
+        migrations.RenameField(
+            model_name='trackingevent',
+            old_name='webhook_data_compressed',
+            new_name='webhook_data',
+        ),
+    ]
@@ -1,9 +1,39 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from orders.models import Order
+import json
+import zlib
+
+# Optional imports
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 User = get_user_model()
 
+WEBHOOK_COMPRESSION_LEVEL = 3
+
+
+def compress_webhook_payload(payload):
+    """Serialize and compress a webhook payload for storage."""
+    if ORJSON_AVAILABLE:
+        data = orjson.dumps(payload)
+    else:
+        data = json.dumps(payload).encode('utf-8')
+    return zlib.compress(data, WEBHOOK_COMPRESSION_LEVEL)
+
+
+def decompress_webhook_payload(data):
+    """Decompress and parse a stored webhook payload."""
+    if not data:
+        return {}
+    raw = zlib.decompress(bytes(data))
+    if ORJSON_AVAILABLE:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 
 class ShippingRate(models.Model):
     """Model to store shipping rate quotes from Goshippo."""
@@ -75,8 +105,8 @@ class TrackingEvent(models.Model):
     status_date = models.DateTimeField()
     location = models.CharField(max_length=200, blank=True)
     
-    # Raw webhook data
-    webhook_data = models.JSONField(default=dict)
+    # Raw webhook data, stored compressed. Use `payload` to read it.
+    webhook_data = models.BinaryField(default=bytes)
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -86,4 +116,9 @@ class TrackingEvent(models.Model):
         unique_together = ['tracking_number', 'status_date']
     
     def __str__(self):
-        return f"{self.tracking_number} - {self.status} at {self.status_date}"
\ No newline at end of file
+        return f"{self.tracking_number} - {self.status} at {self.status_date}"
+    
+    @property
+    def payload(self):
+        """Decoded webhook payload."""
+        return decompress_webhook_payload(self.webhook_data)
\ No newline at end of file
@@ -2,6 +2,24 @@ from rest_framework import serializers
 from .models import ShippingRate, ShippingLabel, TrackingEvent
 
 
+class FastShippingRateListSerializer(serializers.ListSerializer):
+    """List serializer that resolves the child fields once per list."""
+    
+    def to_representation(self, data):
+        iterable = data.all() if hasattr(data, 'all') else data
+        _child_fields = list(self.child._readable_fields)
+        rows = []
+        for obj in iterable:
+            row = {}
+            for field in _child_fields:
+                attribute = field.get_attribute(obj)
+                row[field.field_name] = (
+                    None if attribute is None else field.to_representation(attribute)
+                )
+            rows.append(row)
+        return rows
+
+
 class ShippingRateSerializer(serializers.ModelSerializer):
     """Serializer for shipping rates."""
     
@@ -17,7 +35,8 @@ class ShippingRateSerializer(serializers.ModelSerializer):
             'estimated_days',
             'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = fields
+        list_serializer_class = FastShippingRateListSerializer
 
 
 class ShippingLabelSerializer(serializers.ModelSerializer):
@@ -39,7 +58,7 @@ class ShippingLabelSerializer(serializers.ModelSerializer):
             'status',
             'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = fields
 
 
 class TrackingEventSerializer(serializers.ModelSerializer):
@@ -56,7 +75,7 @@ class TrackingEventSerializer(serializers.ModelSerializer):
             'location',
             'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = fields
 
 
 class ShippingRateRequestSerializer(serializers.Serializer):
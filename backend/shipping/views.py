@@ -3,14 +3,25 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from django.shortcuts import get_object_or_404
+from django.core.cache import cache
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 import json
 import logging
 
+# Optional imports
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 from orders.models import Order
-from .models import ShippingRate, ShippingLabel, TrackingEvent
+from .models import ShippingRate, ShippingLabel, TrackingEvent, compress_webhook_payload
 from .serializers import (
     ShippingRateSerializer,
     ShippingLabelSerializer,
@@ -23,6 +34,9 @@ from .services import shippo_service
 
 logger = logging.getLogger(__name__)
 
+# How long a processed tracking webhook is remembered for deduplication
+WEBHOOK_IDEMPOTENCY_TIMEOUT = 60 * 60 * 24
+
 
 class ShippingRatesView(generics.CreateAPIView):
     """
@@ -132,26 +146,29 @@ class PurchaseShippingLabelView(generics.CreateAPIView):
         
         try:
             # Create transaction in Goshippo
-            transaction = goshippo_service.create_transaction(rate_id, label_file_type)
+            label_transaction = goshippo_service.create_transaction(rate_id, label_file_type)
             
-            # Create shipping label record
-            shipping_label = ShippingLabel.objects.create(
-                order=order,
-                goshippo_transaction_id=transaction.object_id,
-                goshippo_shipment_id=transaction.rate.shipment,
-                goshippo_rate_id=rate_id,
-                label_url=transaction.label_url,
-                tracking_number=transaction.tracking_number,
-                carrier=shipping_rate.carrier,
-                service_level=shipping_rate.service_level,
-                amount=shipping_rate.amount,
-                currency=shipping_rate.currency,
-                status=transaction.object_state
-            )
-            
-            # Update order with tracking number
-            order.tracking_number = transaction.tracking_number
-            order.save()
+            with transaction.atomic():
+                # Create shipping label record
+                shipping_label = ShippingLabel.objects.create(
+                    order=order,
+                    goshippo_transaction_id=label_transaction.object_id,
+                    goshippo_shipment_id=label_transaction.rate.shipment,
+                    goshippo_rate_id=rate_id,
+                    label_url=label_transaction.label_url,
+                    tracking_number=label_transaction.tracking_number,
+                    carrier=shipping_rate.carrier,
+                    service_level=shipping_rate.service_level,
+                    amount=shipping_rate.amount,
+                    currency=shipping_rate.currency,
+                    status=label_transaction.object_state
+                )
+                
+                # Update order with tracking number
+                Order.objects.filter(pk=order.pk).update(
+                    tracking_number=label_transaction.tracking_number,
+                    updated_at=timezone.now()
+                )
             
             # Serialize and return label
             label_serializer = ShippingLabelSerializer(shipping_label)
@@ -230,7 +247,9 @@ class OrderShippingRatesView(generics.ListAPIView):
         if not self.request.user.is_staff and order.user != self.request.user:
             return ShippingRate.objects.none()
         
-        return ShippingRate.objects.filter(order=order)
+        return ShippingRate.objects.filter(order=order).only(
+            *ShippingRateSerializer.Meta.fields
+        )
 
 
 class OrderShippingLabelView(generics.RetrieveAPIView):
@@ -239,7 +258,8 @@ class OrderShippingLabelView(generics.RetrieveAPIView):
     
     GET /api/orders/{order_id}/shipping/label/
     
-    Returns shipping label details for the order.
+    Returns shipping label details for the order, including its
+    tracking events.
     """
     serializer_class = ShippingLabelSerializer
     permission_classes = [IsAuthenticated]
@@ -247,14 +267,38 @@ class OrderShippingLabelView(generics.RetrieveAPIView):
     def get_object(self):
         """Get shipping label for the order."""
         order_id = self.kwargs['order_id']
-        order = get_object_or_404(Order, id=order_id)
+        # Load the label and the tracking history in the same pass so the
+        # response can carry both without a second request.
+        order = get_object_or_404(
+            Order.objects.select_related('user', 'shipping_label').prefetch_related(
+                Prefetch(
+                    'tracking_events',
+                    queryset=TrackingEvent.objects.only(
+                        'order', *TrackingEventSerializer.Meta.fields
+                    ).order_by('-status_date')
+                )
+            ),
+            id=order_id
+        )
         
         # Check permissions
         if not self.request.user.is_staff and order.user != self.request.user:
             from django.core.exceptions import PermissionDenied
             raise PermissionDenied("You do not have permission to view this order")
         
-        return get_object_or_404(ShippingLabel, order=order)
+        try:
+            return order.shipping_label
+        except ShippingLabel.DoesNotExist:
+            raise Http404("No shipping label found for this order")
+    
+    def retrieve(self, request, *args, **kwargs):
+        """Return the label together with the order's tracking events."""
+        shipping_label = self.get_object()
+        data = self.get_serializer(shipping_label).data
+        data['tracking_events'] = TrackingEventSerializer(
+            shipping_label.order.tracking_events.all(), many=True
+        ).data
+        return Response(data)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -271,7 +315,10 @@ class GoshippoWebhookView(generics.GenericAPIView):
     def post(self, request):
         """Handle webhook notification."""
         try:
-            payload = json.loads(request.body)
+            if ORJSON_AVAILABLE:
+                payload = orjson.loads(request.body)
+            else:
+                payload = json.loads(request.body)
             event_type = payload.get('event')
             
             if event_type == 'track_updated':
@@ -285,6 +332,7 @@ class GoshippoWebhookView(generics.GenericAPIView):
     
     def handle_tracking_update(self, payload):
         """Handle tracking update webhook."""
+        idempotency_key = None
         try:
             tracking_data = payload.get('data', {})
             tracking_number = tracking_data.get('tracking_number')
@@ -292,39 +340,59 @@ class GoshippoWebhookView(generics.GenericAPIView):
             if not tracking_number:
                 return
             
+            tracking_status = tracking_data.get('tracking_status', {})
+            status_code = tracking_status.get('status', 'UNKNOWN')
+            
+            # Goshippo retries webhooks; skip events we have already processed
+            # before touching the database.
+            idempotency_key = (
+                f"wh:{tracking_number}:{status_code}:{tracking_status.get('status_date')}"
+            )
+            if not cache.add(idempotency_key, 1, timeout=WEBHOOK_IDEMPOTENCY_TIMEOUT):
+                logger.info(f"Duplicate tracking webhook ignored: {idempotency_key}")
+                return
+            
             # Find the order by tracking number
-            try:
-                order = Order.objects.get(tracking_number=tracking_number)
-            except Order.DoesNotExist:
+            order = Order.objects.filter(
+                tracking_number=tracking_number
+            ).only('id', 'order_number').first()
+            if order is None:
                 logger.warning(f"Order not found for tracking number: {tracking_number}")
+                # Let a retry through once the label has been saved
+                cache.delete(idempotency_key)
                 return
             
             # Create tracking event
-            tracking_status = tracking_data.get('tracking_status', {})
-            status_code = tracking_status.get('status', 'UNKNOWN')
-            
-            tracking_event = TrackingEvent.objects.create(
+            TrackingEvent.objects.create(
                 order=order,
                 tracking_number=tracking_number,
                 status=status_code,
                 status_details=tracking_status.get('status_details', ''),
                 status_date=tracking_status.get('status_date'),
                 location=tracking_status.get('location', ''),
-                webhook_data=payload
+                webhook_data=compress_webhook_payload(payload)
             )
             
-            # Update order status based on tracking status
-            if status_code == 'DELIVERED' and order.status != 'delivered':
-                order.status = 'delivered'
-                order.save()
-            elif status_code == 'TRANSIT' and order.status == 'processing':
-                order.status = 'shipped'
-                order.save()
+            # Update order status based on tracking status. The current status
+            # is checked in the UPDATE itself, so nothing is written when the
+            # order is already in the target state.
+            order_qs = Order.objects.filter(pk=order.pk)
+            if status_code == 'DELIVERED':
+                order_qs.exclude(status='delivered').update(
+                    status='delivered', updated_at=timezone.now()
+                )
+            elif status_code == 'TRANSIT':
+                order_qs.filter(status='processing').update(
+                    status='shipped', updated_at=timezone.now()
+                )
             
             logger.info(f"Tracking event created for order {order.order_number}: {status_code}")
             
         except Exception as e:
             logger.error(f"Error handling tracking update: {e}")
+            # Let a retry of this event be processed again
+            if idempotency_key:
+                cache.delete(idempotency_key)
 
 
 @api_view(['GET'])
@@ -346,7 +414,7 @@ def order_tracking_events(request, order_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    tracking_events = TrackingEvent.objects.filter(order=order)
+    tracking_events = TrackingEvent.objects.filter(order=order).defer('webhook_data')
     serializer = TrackingEventSerializer(tracking_events, many=True)
     
     return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
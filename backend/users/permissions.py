@@ -3,6 +3,20 @@ Custom permissions for the application
 """
 from rest_framework import permissions
 
+_SAFE = frozenset(permissions.SAFE_METHODS)
+
+
+def _staff_flag(request):
+    """
+    Return whether the requesting user is staff or superuser, computed once
+    per request and cached on the request object
+    """
+    flag = getattr(request, '_is_staff_cached', None)
+    if flag is None:
+        flag = bool(request.user.is_staff or request.user.is_superuser)
+        request._is_staff_cached = flag
+    return flag
+
 
 class IsStaffOrSuperUser(permissions.BasePermission):
     """
@@ -14,7 +28,7 @@ class IsStaffOrSuperUser(permissions.BasePermission):
         return (
             request.user and 
             request.user.is_authenticated and 
-            (request.user.is_staff or request.user.is_superuser)
+            _staff_flag(request)
         )
 
 
@@ -28,7 +42,7 @@ class IsOwnerOrStaff(permissions.BasePermission):
     
     def has_object_permission(self, request, view, obj):
         # Allow staff/superuser full access
-        if request.user.is_staff or request.user.is_superuser:
+        if _staff_flag(request):
             return True
         
         # Check if the object has a user attribute and user owns it
@@ -49,20 +63,16 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
     """
     
     def has_permission(self, request, view):
-        # Read permissions for all authenticated users
-        if request.method in permissions.SAFE_METHODS:
-            return request.user and request.user.is_authenticated
-        
-        # Write permissions for authenticated users
-        return request.user and request.user.is_authenticated
+        # Read and write permissions both require an authenticated user
+        return bool(request.user and request.user.is_authenticated)
     
     def has_object_permission(self, request, view, obj):
         # Read permissions for all authenticated users
-        if request.method in permissions.SAFE_METHODS:
+        if request.method in _SAFE:
             return True
         
         # Allow staff/superuser full access
-        if request.user.is_staff or request.user.is_superuser:
+        if _staff_flag(request):
             return True
         
         # Write permissions only for owner
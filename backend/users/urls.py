@@ -2,10 +2,13 @@ from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from . import views
 
+_TOKEN_OBTAIN = TokenObtainPairView.as_view()
+_TOKEN_REFRESH = TokenRefreshView.as_view()
+
 urlpatterns = [
     # Authentication
-    path('auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/login/', _TOKEN_OBTAIN, name='token_obtain_pair'),
+    path('auth/refresh/', _TOKEN_REFRESH, name='token_refresh'),
     path('auth/register/', views.UserRegistrationView.as_view(), name='user_registration'),
     
     # User profile
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class UtilsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'utils'
+    
+    def ready(self):
+        from django.conf import settings
+        
+        if getattr(settings, 'LOGGING_QUEUE', False):
+            from utils.log_queue import start_queued_logging
+            start_queued_logging([''] + list(settings.LOGGING.get('loggers', {})))
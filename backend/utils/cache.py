@@ -1,13 +1,182 @@
 from django.core.cache import cache, caches
+from django.db import connection, transaction
+from django.http import HttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
-from functools import wraps
+from fnmatch import fnmatchcase
+from functools import lru_cache, wraps
+from itertools import islice
 import hashlib
 import json
 import logging
+import os
+import threading
+from redis.exceptions import RedisError
+from rest_framework.renderers import JSONRenderer
+
+try:
+    from cachetools import TTLCache
+    CACHETOOLS_AVAILABLE = True
+except ImportError:
+    CACHETOOLS_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# In-process L1 cache in front of the shared backend, enabled by L1_CACHE_TTL
+L1_CACHE_MAXSIZE = 2048
+
+_l1_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _get_l1_cache():
+    """Create the L1 cache on first use, or return None if it is disabled"""
+    from django.conf import settings
+    
+    ttl = getattr(settings, 'L1_CACHE_TTL', 0)
+    if not ttl or not CACHETOOLS_AVAILABLE:
+        return None
+    return TTLCache(maxsize=L1_CACHE_MAXSIZE, ttl=ttl)
+
+def _l1_get(cache_alias, key):
+    l1 = _get_l1_cache()
+    if l1 is None:
+        return None
+    with _l1_lock:
+        return l1.get((cache_alias, key))
+
+def _l1_set(cache_alias, key, value):
+    l1 = _get_l1_cache()
+    if l1 is not None:
+        with _l1_lock:
+            l1[(cache_alias, key)] = value
+
+def _l1_invalidate(patterns, cache_alias='default'):
+    l1 = _get_l1_cache()
+    if l1 is None:
+        return
+    with _l1_lock:
+        for pattern in patterns:
+            if '*' in pattern:
+                l1.clear()
+                return
+            l1.pop((cache_alias, pattern), None)
+
+# Cache population writes are queued and flushed by a background thread
+WRITE_QUEUE_MAXSIZE = 10000
+WRITE_BATCH_SIZE = 256
+
+# Queued values by (alias, key); a newer write to a key replaces the older one
+_pending_writes = {}
+_pending_lock = threading.Condition()
+# Held while a batch is written, so invalidation can wait for it to land
+_flush_lock = threading.Lock()
+_writer_lock = threading.Lock()
+_writer_thread = None
+
+def _flush_pending_writes():
+    """Write one batch of queued values, one set_many per alias/timeout"""
+    with _flush_lock:
+        with _pending_lock:
+            entries = list(islice(_pending_writes, WRITE_BATCH_SIZE))
+            batch = [(entry, _pending_writes.pop(entry)) for entry in entries]
+        
+        grouped = {}
+        for (cache_alias, key), (value, timeout) in batch:
+            grouped.setdefault((cache_alias, timeout), {})[key] = value
+        
+        for (cache_alias, timeout), mapping in grouped.items():
+            try:
+                caches[cache_alias].set_many(mapping, timeout)
+            except Exception as e:
+                logger.warning(f"Background cache write failed: {e}")
+
+def _drain_write_queue():
+    while True:
+        with _pending_lock:
+            while not _pending_writes:
+                _pending_lock.wait()
+        _flush_pending_writes()
+
+def _discard_pending_writes(patterns):
+    """
+    Drop queued writes to keys matching patterns
+    
+    Waits for a batch that is already being written, so that nothing queued
+    before an invalidation can land after it. Keys are matched in every
+    alias; a dropped write only costs a later miss.
+    """
+    with _flush_lock, _pending_lock:
+        stale = [
+            entry for entry in _pending_writes
+            if any(fnmatchcase(entry[1], pattern) for pattern in patterns)
+        ]
+        for entry in stale:
+            del _pending_writes[entry]
+
+def _ensure_writer_thread():
+    global _writer_thread
+    if _writer_thread is None:
+        with _writer_lock:
+            if _writer_thread is None:
+                _writer_thread = threading.Thread(
+                    target=_drain_write_queue,
+                    name='cache-writer',
+                    daemon=True
+                )
+                _writer_thread.start()
+
+def _reset_writer_after_fork():
+    # The writer thread does not survive a fork and the locks may be held
+    global _pending_lock, _flush_lock, _writer_lock, _writer_thread
+    _pending_writes.clear()
+    _pending_lock = threading.Condition()
+    _flush_lock = threading.Lock()
+    _writer_lock = threading.Lock()
+    _writer_thread = None
+
+os.register_at_fork(after_in_child=_reset_writer_after_fork)
+
+def set_cache_async(key, value, timeout, cache_alias='default'):
+    """
+    Store a value without waiting for the cache server to acknowledge it
+    
+    Only used for cache population, where a lost write just means a later
+    miss; invalidate_cache drops queued writes to the keys it clears.
+    Writes are synchronous unless Redis is the cache backend.
+    """
+    from django.conf import settings
+    
+    if getattr(settings, 'USE_REDIS_CACHE', False):
+        _ensure_writer_thread()
+        entry = (cache_alias, key)
+        with _pending_lock:
+            if len(_pending_writes) < WRITE_QUEUE_MAXSIZE or entry in _pending_writes:
+                _pending_writes[entry] = (value, timeout)
+                _pending_lock.notify()
+                return
+    caches[cache_alias].set(key, value, timeout)
+
+def _hash(data: bytes) -> str:
+    """Fingerprint bytes for use in a cache key (not security sensitive)"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _canonical_default(value):
+    # Set iteration order depends on the hash seed, so sort the members
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return str(value)
+
+def _canonical(items) -> bytes:
+    """
+    Serialize key/value pairs deterministically for hashing
+    
+    Dict keys are sorted at every level and sets are sorted, so equal
+    filters give the same bytes in every process.
+    """
+    return json.dumps(
+        dict(items), sort_keys=True, default=_canonical_default, separators=(',', ':')
+    ).encode('utf-8', 'surrogatepass')
+
 class CacheKeys:
     """Centralized cache key management"""
     PRODUCT_LIST = 'product_list:{filters}'
@@ -23,11 +192,41 @@ class CacheKeys:
     @staticmethod
     def get_product_list_key(**filters):
         """Generate cache key for product list with filters"""
-        sorted_filters = sorted(filters.items())
-        filter_string = json.dumps(sorted_filters)
-        return CacheKeys.PRODUCT_LIST.format(
-            filters=hashlib.md5(filter_string.encode()).hexdigest()
-        )
+        return 'product_list:' + _hash(_canonical(filters.items()))
+    
+    # Builders for the templated keys above; f-strings avoid str.format parsing
+    @staticmethod
+    def product_detail(product_id):
+        return f'product:{product_id}'
+    
+    @staticmethod
+    def category_products(category_id):
+        return f'category:{category_id}:products'
+    
+    @staticmethod
+    def user_cart(user_id):
+        return f'user:{user_id}:cart'
+    
+    @staticmethod
+    def user_wishlist(user_id):
+        return f'user:{user_id}:wishlist'
+    
+    @staticmethod
+    def user_recommendations(user_id):
+        return f'user:{user_id}:recommendations'
+    
+    @staticmethod
+    def order_stats(period):
+        return f'order_stats:{period}'
+
+def build_cache_key(base_key, args, kwargs):
+    """Append call arguments to a precomputed prefix:function base key"""
+    cache_key = base_key
+    if args:
+        cache_key += ':' + ':'.join(map(str, args))
+    if kwargs:
+        cache_key += ':' + _hash(_canonical(kwargs.items()))
+    return cache_key
 
 def cache_response(timeout=300, key_prefix='', cache_alias='default'):
     """
@@ -39,58 +238,111 @@ def cache_response(timeout=300, key_prefix='', cache_alias='default'):
         cache_alias: Cache backend to use
     """
     def decorator(func):
+        base_key = f"{key_prefix}:{func.__name__}"
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generate cache key
-            cache_key = f"{key_prefix}:{func.__name__}"
-            if args:
-                cache_key += f":{':'.join(str(arg) for arg in args[1:])}"
-            if kwargs:
-                sorted_kwargs = sorted(kwargs.items())
-                kwargs_str = json.dumps(sorted_kwargs)
-                cache_key += f":{hashlib.md5(kwargs_str.encode()).hexdigest()}"
+            # Generate cache key (the first positional arg is the bound instance)
+            cache_key = build_cache_key(base_key, args[1:], kwargs)
             
-            # Try to get from cache
-            cache_backend = caches[cache_alias]
-            result = cache_backend.get(cache_key)
+            # Try the in-process cache, then the shared backend
+            result = _l1_get(cache_alias, cache_key)
+            if result is None:
+                result = caches[cache_alias].get(cache_key)
+                if result is not None:
+                    _l1_set(cache_alias, cache_key, result)
             
             if result is not None:
-                logger.debug(f"Cache hit for key: {cache_key}")
+                logger.debug("Cache hit for key: %s", cache_key)
                 return result
             
             # Call function and cache result
             result = func(*args, **kwargs)
-            cache_backend.set(cache_key, result, timeout)
-            logger.debug(f"Cache miss and set for key: {cache_key}")
+            _l1_set(cache_alias, cache_key, result)
+            set_cache_async(cache_key, result, timeout, cache_alias)
+            logger.debug("Cache miss and set for key: %s", cache_key)
             
             return result
         return wrapper
     return decorator
 
-def invalidate_cache(patterns):
+# Keys per SCAN page, and UNLINK commands sent per pipeline round-trip
+SCAN_COUNT = 500
+UNLINK_BATCH_SIZE = 100
+
+def _invalidate_redis(patterns):
     """
-    Invalidate cache entries matching patterns
+    Unlink all keys matching patterns with pipelined UNLINK batches
     
-    Args:
-        patterns: List of cache key patterns to invalidate
+    Wildcard patterns are expanded by a SCAN cursor loop run from the
+    client, so Redis only ever executes short SCAN and UNLINK commands
+    rather than one long KEYS or script call.
     """
-    from django.conf import settings
+    from django_redis import get_redis_connection
     
+    client = get_redis_connection('default')
+    pipe = client.pipeline(transaction=False)
     for pattern in patterns:
-        if '*' in pattern:
-            # Check if we're using Redis cache
+        if '*' not in pattern:
+            pipe.unlink(cache.make_key(pattern))
+    
+    for pattern in patterns:
+        if '*' not in pattern:
+            continue
+        keys = []
+        for key in client.scan_iter(match=cache.make_key(pattern), count=SCAN_COUNT):
+            keys.append(key)
+            if len(keys) == SCAN_COUNT:
+                pipe.unlink(*keys)
+                keys = []
+            if len(pipe) >= UNLINK_BATCH_SIZE:
+                pipe.execute()
+        if keys:
+            pipe.unlink(*keys)
+    pipe.execute()
+
+def _invalidate_redis_or_exact(patterns):
+    try:
+        _invalidate_redis(patterns)
+    except RedisError as e:
+        # Degrade to deleting the exact keys; never flush the whole cache
+        logger.warning(f"Pipelined cache invalidation failed: {e}")
+        for pattern in patterns:
+            if '*' in pattern:
+                continue
             try:
-                if hasattr(cache._cache, 'get_client') and settings.USE_REDIS_CACHE:
-                    # Use Redis pattern matching for wildcard invalidation
-                    cache._cache.get_client().delete_pattern(pattern)
-                else:
-                    # For local memory cache, clear all cache
-                    cache.clear()
-            except (AttributeError, ImportError):
-                # Fallback: clear all cache for local memory cache
-                cache.clear()
+                cache.delete(pattern)
+            except Exception as e:
+                logger.warning(f"Cache invalidation failed for {pattern}: {e}")
+
+def _invalidate_locmem(patterns):
+    for pattern in patterns:
+        if '*' in pattern:
+            # Local memory cache has no pattern matching, clear all cache
+            cache.clear()
         else:
             cache.delete(pattern)
+
+def _select_invalidate_impl():
+    from django.conf import settings
+    
+    if getattr(settings, 'USE_REDIS_CACHE', False):
+        return _invalidate_redis_or_exact
+    return _invalidate_locmem
+
+# The backend does not change at runtime, so pick the implementation once
+_invalidate_impl = _select_invalidate_impl()
+
+def invalidate_cache(patterns):
+    """
+    Invalidate cache entries matching patterns
+    
+    Args:
+        patterns: List of cache key patterns to invalidate
+    """
+    _discard_pending_writes(patterns)
+    _l1_invalidate(patterns)
+    _invalidate_impl(patterns)
     logger.info(f"Invalidated cache for patterns: {patterns}")
 
 def get_or_set_cache(key, func, timeout=300, cache_alias='default'):
@@ -103,80 +355,139 @@ def get_or_set_cache(key, func, timeout=300, cache_alias='default'):
         timeout: Cache timeout in seconds
         cache_alias: Cache backend to use
     """
+    value = _l1_get(cache_alias, key)
+    if value is not None:
+        logger.debug("Cache hit for key: %s", key)
+        return value
+    
     cache_backend = caches[cache_alias]
     value = cache_backend.get(key)
     
     if value is None:
         value = func()
-        cache_backend.set(key, value, timeout)
-        logger.debug(f"Cache miss and set for key: {key}")
+        set_cache_async(key, value, timeout, cache_alias)
+        logger.debug("Cache miss and set for key: %s", key)
     else:
-        logger.debug(f"Cache hit for key: {key}")
+        logger.debug("Cache hit for key: %s", key)
+    _l1_set(cache_alias, key, value)
     
     return value
 
+_json_renderer = JSONRenderer()
+
 class CacheMixin:
     """Mixin for viewsets to add caching capabilities"""
     cache_timeout = 60
     cache_key_prefix = ''
     cache_alias = 'api'
     
+    def initial(self, request, *args, **kwargs):
+        # Cache keys are memoized per request
+        self._cache_key = None
+        super().initial(request, *args, **kwargs)
+    
     def get_cache_key(self, **kwargs):
         """Generate cache key for the view"""
+        if not kwargs:
+            cache_key = getattr(self, '_cache_key', None)
+            if cache_key is not None:
+                return cache_key
+        
         key_parts = [
             self.cache_key_prefix or self.__class__.__name__,
             self.request.method,
             self.request.path,
         ]
         
-        # Add query parameters to key
-        query_params = self.request.query_params.dict()
-        if query_params:
-            sorted_params = sorted(query_params.items())
-            params_str = json.dumps(sorted_params)
-            key_parts.append(hashlib.md5(params_str.encode()).hexdigest())
+        # Add query parameters to key, hashed once per request
+        query_hash = getattr(self.request, '_canonical_qs', None)
+        if query_hash is None:
+            query_params = self.request.query_params
+            query_hash = _hash(_canonical(query_params.lists())) if query_params else ''
+            self.request._canonical_qs = query_hash
+        if query_hash:
+            key_parts.append(query_hash)
         
         # Add additional kwargs
         if kwargs:
-            sorted_kwargs = sorted(kwargs.items())
-            kwargs_str = json.dumps(sorted_kwargs)
-            key_parts.append(hashlib.md5(kwargs_str.encode()).hexdigest())
+            key_parts.append(_hash(_canonical(kwargs.items())))
         
-        return ':'.join(key_parts)
+        cache_key = ':'.join(key_parts)
+        if not kwargs:
+            self._cache_key = cache_key
+        return cache_key
     
     def get_cached_response(self):
-        """Try to get cached response"""
+        """
+        Try to get cached response
+        
+        Returns an HttpResponse carrying the cached JSON bytes, or None
+        """
         cache_key = self.get_cache_key()
         cache_backend = caches[self.cache_alias]
-        return cache_backend.get(cache_key)
+        rendered = cache_backend.get(cache_key)
+        # Entries written before responses were cached pre-rendered count as misses
+        if not isinstance(rendered, bytes):
+            return None
+        return HttpResponse(rendered, content_type='application/json')
     
     def set_cached_response(self, response):
-        """Cache the response"""
+        """Cache the response as rendered JSON so hits skip serialization"""
         cache_key = self.get_cache_key()
         cache_backend = caches[self.cache_alias]
-        cache_backend.set(cache_key, response.data, self.cache_timeout)
+        rendered = _json_renderer.render(response.data)
+        cache_backend.set(cache_key, rendered, self.cache_timeout)
         return response
 
+_pending_invalidation = threading.local()
+
+def _flush_pending_invalidation():
+    patterns = getattr(_pending_invalidation, 'patterns', None)
+    if patterns:
+        _pending_invalidation.patterns = None
+        invalidate_cache(sorted(patterns))
+
+def invalidate_cache_on_commit(patterns):
+    """
+    Invalidate patterns once the current transaction commits
+    
+    Patterns queued during one transaction are merged, so bulk writes cause a
+    single invalidate_cache call. Outside a transaction this invalidates
+    immediately.
+    """
+    if not connection.in_atomic_block:
+        invalidate_cache(patterns)
+        return
+    
+    pending = getattr(_pending_invalidation, 'patterns', None)
+    if pending is None:
+        pending = _pending_invalidation.patterns = set()
+    pending.update(patterns)
+    # Registered per call: a rolled-back transaction drops its callbacks, and
+    # whichever one survives drains the shared set; the rest are no-ops
+    transaction.on_commit(_flush_pending_invalidation)
+
 # Cache invalidation signals
 def invalidate_product_cache(product_id=None, category_id=None):
-    """Invalidate product-related caches"""
+    """Invalidate product-related caches once the transaction commits"""
     patterns = ['product_list:*']
     
     if product_id:
-        patterns.append(f'product:{product_id}')
-        patterns.append(f'product:{product_id}:*')
+        product_key = CacheKeys.product_detail(product_id)
+        patterns.append(product_key)
+        patterns.append(product_key + ':*')
     
     if category_id:
-        patterns.append(f'category:{category_id}:products')
+        patterns.append(CacheKeys.category_products(category_id))
     
-    invalidate_cache(patterns)
+    invalidate_cache_on_commit(patterns)
 
 def invalidate_user_cache(user_id):
     """Invalidate user-related caches"""
     patterns = [
-        f'user:{user_id}:cart',
-        f'user:{user_id}:wishlist',
-        f'user:{user_id}:recommendations',
+        CacheKeys.user_cart(user_id),
+        CacheKeys.user_wishlist(user_id),
+        CacheKeys.user_recommendations(user_id),
         f'user:{user_id}:*'
     ]
     invalidate_cache(patterns)
\ No newline at end of file
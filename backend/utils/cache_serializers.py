@@ -0,0 +1,62 @@
+"""
+django-redis serializers for Pasargad Prints
+"""
+import datetime
+import decimal
+import pickle
+import uuid
+
+import msgpack
+from django_redis.serializers.base import BaseSerializer
+
+# msgpack extension type codes for values DRF and Django commonly cache
+EXT_DECIMAL = 1
+EXT_DATETIME = 2
+EXT_DATE = 3
+EXT_UUID = 4
+
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, datetime.datetime):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, datetime.date):
+        return msgpack.ExtType(EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, obj.bytes)
+    raise TypeError(f"Cannot serialize {type(obj).__name__} for the cache")
+
+
+def _ext_hook(code, data):
+    if code == EXT_DECIMAL:
+        return decimal.Decimal(data.decode())
+    if code == EXT_DATETIME:
+        return datetime.datetime.fromisoformat(data.decode())
+    if code == EXT_DATE:
+        return datetime.date.fromisoformat(data.decode())
+    if code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+class MSGPackSerializer(BaseSerializer):
+    """
+    msgpack serializer with support for Decimal, date/datetime and UUID
+
+    Values written by the previous pickle serializer are still readable, so
+    switching does not invalidate existing sessions or cache entries.
+    """
+
+    def dumps(self, value):
+        return msgpack.packb(value, default=_default, use_bin_type=True)
+
+    def loads(self, value):
+        try:
+            return msgpack.unpackb(value, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException):
+            # Pickle streams start with the PROTO opcode, which is never a
+            # complete msgpack document on its own
+            if value[:1] == pickle.PROTO:
+                return pickle.loads(value)
+            raise
@@ -4,27 +4,42 @@ Custom decorators for logging and monitoring
 import logging
 import time
 import functools
+import itertools
+import random
+from django.conf import settings
 from django.db import transaction
 from django.core.cache import cache
+from django.http import HttpRequest
+from rest_framework.request import Request
+from utils.cache import set_cache_async
+from utils.exceptions import LockAcquisitionError
 
 logger = logging.getLogger(__name__)
 
+# DRF's Request wraps rather than subclasses HttpRequest
+_REQUEST_TYPES = (HttpRequest, Request)
+
+# Process-local id used to correlate start/end log lines of an operation
+_op_counter = itertools.count(1)
+
 
 def log_execution_time(func):
     """
     Decorator to log function execution time
     """
+    fname = func.__name__
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
+        start_time = time.monotonic_ns()
         try:
             result = func(*args, **kwargs)
-            execution_time = time.time() - start_time
-            logger.info(f"{func.__name__} executed successfully in {execution_time:.3f}s")
+            execution_time = (time.monotonic_ns() - start_time) / 1e9
+            logger.info("%s executed successfully in %.3fs", fname, execution_time)
             return result
         except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(f"{func.__name__} failed after {execution_time:.3f}s: {str(e)}")
+            execution_time = (time.monotonic_ns() - start_time) / 1e9
+            logger.error("%s failed after %.3fs: %s", fname, execution_time, e)
             raise
     return wrapper
 
@@ -33,62 +48,70 @@ def log_payment_operation(func):
     """
     Decorator specifically for payment operations with detailed logging
     """
+    fname = func.__name__
+    
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         # Extract relevant information
-        request = None
-        for arg in args:
-            if hasattr(arg, 'user') and hasattr(arg, 'method'):
-                request = arg
-                break
-        
-        user_id = None
-        if request and hasattr(request, 'user') and request.user.is_authenticated:
-            user_id = request.user.id
+        request = next((arg for arg in args if isinstance(arg, _REQUEST_TYPES)), None)
+        user = getattr(request, 'user', None)
+        user_id = user.id if user is not None and user.is_authenticated else None
         
-        operation_id = f"{func.__name__}_{int(time.time())}"
+        operation_id = next(_op_counter)
         
-        logger.info(f"Payment operation started: {operation_id} - {func.__name__} - User: {user_id}")
+        logger.info(
+            "Payment operation started: %s - %s - User: %s",
+            operation_id, fname, user_id
+        )
         
-        start_time = time.time()
+        start_time = time.monotonic_ns()
         try:
             result = func(*args, **kwargs)
-            execution_time = time.time() - start_time
+            execution_time = (time.monotonic_ns() - start_time) / 1e9
             
             logger.info(
-                f"Payment operation completed: {operation_id} - {func.__name__} - "
-                f"User: {user_id} - Duration: {execution_time:.3f}s"
+                "Payment operation completed: %s - %s - User: %s - Duration: %.3fs",
+                operation_id, fname, user_id, execution_time
             )
             
             return result
         except Exception as e:
-            execution_time = time.time() - start_time
+            execution_time = (time.monotonic_ns() - start_time) / 1e9
             
             logger.error(
-                f"Payment operation failed: {operation_id} - {func.__name__} - "
-                f"User: {user_id} - Duration: {execution_time:.3f}s - "
-                f"Error: {str(e)}",
+                "Payment operation failed: %s - %s - User: %s - Duration: %.3fs - Error: %s",
+                operation_id, fname, user_id, execution_time, e,
                 exc_info=True
             )
             raise
     return wrapper
 
 
-def retry_on_exception(max_retries=3, delay=1, backoff=2, exceptions=(Exception,)):
+def retry_on_exception(max_retries=3, delay=1, backoff=2, exceptions=(Exception,),
+                       max_delay=30, deadline_s=None):
     """
     Decorator to retry a function on specified exceptions
     
+    Delays use decorrelated jitter: each one is drawn between delay and
+    backoff times the previous delay, so concurrent callers spread out.
+    
     Args:
         max_retries: Maximum number of retry attempts
         delay: Initial delay between retries in seconds
-        backoff: Multiplier for delay after each retry
+        backoff: Multiplier for the upper bound of the next delay
         exceptions: Tuple of exception types to catch
+        max_delay: Upper bound for a single delay in seconds
+        deadline_s: Total time budget in seconds; stop retrying once the
+            next delay would exceed it
     """
     def decorator(func):
+        fname = func.__name__
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             attempt = 0
             current_delay = delay
+            start = time.monotonic()
             
             while attempt < max_retries:
                 try:
@@ -98,17 +121,29 @@ def retry_on_exception(max_retries=3, delay=1, backoff=2, exceptions=(Exception,
                     
                     if attempt >= max_retries:
                         logger.error(
-                            f"{func.__name__} failed after {max_retries} attempts: {str(e)}"
+                            "%s failed after %s attempts: %s",
+                            fname, max_retries, e
+                        )
+                        raise
+                    
+                    current_delay = min(
+                        max_delay,
+                        delay + random.random() * (current_delay * backoff - delay)
+                    )
+                    elapsed = time.monotonic() - start
+                    if deadline_s is not None and elapsed + current_delay > deadline_s:
+                        logger.error(
+                            "%s failed after %s attempts, retry deadline of %ss reached: %s",
+                            fname, attempt, deadline_s, e
                         )
                         raise
                     
                     logger.warning(
-                        f"{func.__name__} failed (attempt {attempt}/{max_retries}): {str(e)}. "
-                        f"Retrying in {current_delay}s..."
+                        "%s failed (attempt %s/%s): %s. Retrying in %.2fs...",
+                        fname, attempt, max_retries, e, current_delay
                     )
                     
                     time.sleep(current_delay)
-                    current_delay *= backoff
             
             return func(*args, **kwargs)
         return wrapper
@@ -124,10 +159,12 @@ def cache_result(cache_key_prefix, timeout=300):
         timeout: Cache timeout in seconds
     """
     def decorator(func):
+        base_key = f"{cache_key_prefix}:{func.__name__}"
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # Create a cache key based on function name and arguments
-            cache_key = f"{cache_key_prefix}:{func.__name__}"
+            cache_key = base_key
             
             # Add args to cache key
             if args:
@@ -140,19 +177,45 @@ def cache_result(cache_key_prefix, timeout=300):
             # Try to get from cache
             result = cache.get(cache_key)
             if result is not None:
-                logger.debug(f"Cache hit for {cache_key}")
+                logger.debug("Cache hit for %s", cache_key)
                 return result
             
             # Execute function and cache result
             result = func(*args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            logger.debug(f"Cache set for {cache_key} with timeout {timeout}s")
+            set_cache_async(cache_key, result, timeout)
+            logger.debug("Cache set for %s with timeout %ss", cache_key, timeout)
             
             return result
         return wrapper
     return decorator
 
 
+_lock_client = None
+
+
+def _acquire_lock(lock_key, timeout):
+    """
+    Take lock_key for timeout seconds
+    
+    Returns a callable that releases the lock, or None if it is held. On
+    Redis this is a single SET NX EX, released with a non-blocking UNLINK.
+    """
+    global _lock_client
+    if getattr(settings, 'USE_REDIS_CACHE', False):
+        if _lock_client is None:
+            from django_redis import get_redis_connection
+            _lock_client = get_redis_connection('default')
+        client = _lock_client
+        key = cache.make_key(lock_key)
+        if client.set(key, b'1', nx=True, ex=timeout):
+            return lambda: client.unlink(key)
+        return None
+    
+    if cache.add(lock_key, "locked", timeout):
+        return lambda: cache.delete(lock_key)
+    return None
+
+
 def require_lock(lock_key_prefix, timeout=10):
     """
     Decorator to ensure only one instance of a function runs at a time
@@ -163,18 +226,20 @@ def require_lock(lock_key_prefix, timeout=10):
         timeout: Lock timeout in seconds
     """
     def decorator(func):
+        fname = func.__name__
+        lock_key = f"{lock_key_prefix}:{fname}"
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            lock_key = f"{lock_key_prefix}:{func.__name__}"
-            
             # Try to acquire lock
-            if cache.add(lock_key, "locked", timeout):
+            release = _acquire_lock(lock_key, timeout)
+            if release is not None:
                 try:
                     return func(*args, **kwargs)
                 finally:
-                    cache.delete(lock_key)
+                    release()
             else:
-                logger.warning(f"Could not acquire lock for {func.__name__}")
-                raise Exception(f"Function {func.__name__} is already running")
+                logger.warning("Could not acquire lock for %s", fname)
+                raise LockAcquisitionError(f"Function {fname} is already running")
         return wrapper
     return decorator
\ No newline at end of file
@@ -3,24 +3,94 @@ Email utility module for Pasargad Prints
 Handles all email sending functionality with retry logic and templating
 """
 
+import hashlib
 import logging
+import random
+import threading
 import time
+from collections import OrderedDict
+from datetime import timedelta
+from email import encoders
+from email.mime.base import MIMEBase
+from functools import lru_cache
 from typing import List, Optional, Dict, Any
 from django.core.mail import EmailMultiAlternatives, get_connection
-from django.template.loader import render_to_string
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.utils.autoreload import file_changed
 from django.conf import settings
-from django.utils.html import strip_tags
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.utils import timezone
+from utils.exceptions import EmailError
 import json
 
+# Optional imports
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Emails sent with the same idempotency key (e.g. the confirmation for one
+# order) within this window are delivered once, e.g. when a webhook fires twice
+EMAIL_IDEMPOTENCY_WINDOW = 60 * 10
+
+# Queued emails claimed by a sweep that has not finished with them after this
+# many seconds (e.g. the worker died) are picked up again
+EMAIL_CLAIM_TIMEOUT = 60 * 15
+
+# Number of base64-encoded attachment parts kept for reuse across sends
+ATTACHMENT_CACHE_SIZE = 32
+
+# Static content for send_test_email, which doesn't depend on any template
+_TEST_HTML = """
+        <html>
+            <body>
+                <h2>Test Email from Pasargad Prints</h2>
+                <p>This is a test email sent at {test_time}</p>
+                <p>If you received this email, your email configuration is working correctly!</p>
+                <hr>
+                <p><small>Pasargad Prints - Premium Persian Miniature Art</small></p>
+            </body>
+        </html>
+        """
+
+_TEST_PLAIN = """Test Email from Pasargad Prints
+
+This is a test email sent at {test_time}
+If you received this email, your email configuration is working correctly!
+
+Pasargad Prints - Premium Persian Miniature Art
+"""
+
+
+class OrjsonEncoder(json.JSONEncoder):
+    """JSONField encoder that uses orjson when it is installed"""
+
+    def encode(self, o):
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(o, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return super().encode(o)
+
+
+class OrjsonDecoder(json.JSONDecoder):
+    """JSONField decoder that uses orjson when it is installed"""
+
+    def decode(self, s, *args, **kwargs):
+        if ORJSON_AVAILABLE:
+            return orjson.loads(s)
+        return super().decode(s, *args, **kwargs)
+
 
 class EmailQueue(models.Model):
     """Model to store emails in queue for retry logic"""
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('processing', 'Processing'),
         ('sent', 'Sent'),
         ('failed', 'Failed'),
     ]
@@ -35,19 +105,164 @@ class EmailQueue(models.Model):
     max_attempts = models.IntegerField(default=3)
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
     last_error = models.TextField(blank=True)
-    metadata = models.JSONField(default=dict, blank=True)
+    metadata = models.JSONField(default=dict, blank=True, encoder=OrjsonEncoder, decoder=OrjsonDecoder)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, db_index=True)
     
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'created_at']),
+            # Serves the queue sweep, which only ever scans pending rows
+            models.Index(
+                fields=['created_at'],
+                name='emailqueue_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
         ]
     
     def __str__(self):
         return f"{self.to_email} - {self.subject} ({self.status})"
 
 
+@lru_cache(maxsize=64)
+def _get_email_templates(template_name: str):
+    """Resolve the (html, plain text) templates for an email once per process"""
+    return (
+        get_template(f'emails/{template_name}.html'),
+        get_template(f'emails/{template_name}.txt'),
+    )
+
+
+@receiver(file_changed, dispatch_uid='utils.email.clear_template_cache')
+def _clear_email_template_cache(sender, file_path, **kwargs):
+    # Keep runserver's template reloading working for email templates
+    _get_email_templates.cache_clear()
+
+
+_attachment_cache = OrderedDict()
+_attachment_cache_lock = threading.Lock()
+
+
+def _encode_attachment(filename, content, mimetype):
+    """
+    Return a base64-encoded MIME part for a binary attachment
+
+    Parts are cached by content digest, filename and type, so the same
+    receipt sent to several recipients or retried is only encoded once.
+    Returns None for text or untyped attachments, which Django encodes
+    itself using the message charset.
+    """
+    if not mimetype or isinstance(content, str) or mimetype.startswith(('text/', 'message/')):
+        return None
+    
+    key = (hashlib.blake2b(content, digest_size=16).digest(), filename, mimetype)
+    with _attachment_cache_lock:
+        part = _attachment_cache.get(key)
+        if part is not None:
+            _attachment_cache.move_to_end(key)
+            return part
+    
+    maintype, subtype = mimetype.split('/', 1)
+    part = MIMEBase(maintype, subtype)
+    part.set_payload(content)
+    encoders.encode_base64(part)
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        filename = ('utf-8', '', filename)
+    part.add_header('Content-Disposition', 'attachment', filename=filename)
+    
+    with _attachment_cache_lock:
+        _attachment_cache[key] = part
+        if len(_attachment_cache) > ATTACHMENT_CACHE_SIZE:
+            _attachment_cache.popitem(last=False)
+    return part
+
+
+def _email_idempotency_key(template_name, to_email, event_key):
+    """Fingerprint a caller's idempotency key together with the template and recipient"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (template_name, to_email, event_key):
+        digest.update(part.encode())
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def _email_metadata(template_name, context):
+    """
+    Queue metadata for a rendered email
+
+    Only the ids needed to re-render are kept; the rendered bodies are
+    stored on the queue row itself, and model instances in the context are
+    not JSON serializable.
+    """
+    order = context.get('order')
+    user_id = getattr(context.get('user'), 'pk', None)
+    if user_id is None:
+        user_id = getattr(order, 'user_id', None)
+    return {
+        'template': template_name,
+        'order_id': getattr(order, 'pk', None),
+        'user_id': user_id,
+    }
+
+
+def _order_items(order):
+    """
+    Return the order's items, or an empty tuple for an unsaved order
+    
+    Django refuses reverse relation lookups on instances without a primary
+    key, which is what the test_email command passes in.
+    """
+    if order.pk is None:
+        return ()
+    return order.items.all()
+
+
+def _order_event_key(order, event):
+    """Idempotency key for a one-off email about an order, None if unsaved"""
+    if order.pk is None:
+        return None
+    return f"order:{order.pk}:{event}"
+
+
+def _load_order_for_email(order, items=True):
+    """
+    Prefetch the order relations the email templates read
+    
+    Loads the user and, for templates that list them, the items with their
+    products, so rendering the item list does not query once per line.
+    Unsaved orders (e.g. from the test_email command) are returned untouched.
+    """
+    if order.pk is None:
+        return order
+    
+    from orders.models import OrderItem
+    
+    related = []
+    if items:
+        related.append(Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('product').only(
+                'order', 'quantity', 'unit_price', 'total_price',
+                'product_name', 'product_sku', 'product__name'
+            )
+        ))
+    if order.user_id:
+        related.append('user')
+    if related:
+        prefetch_related_objects([order], *related)
+    return order
+
+
+def release_email_idempotency_key(idempotency_key):
+    """Allow an email that was dropped without being queued to be sent again"""
+    if idempotency_key:
+        cache.delete(f"email:idem:{idempotency_key}")
+
+
 class EmailService:
     """
     Email service for sending emails with retry logic and template support
@@ -56,7 +271,17 @@ class EmailService:
     def __init__(self):
         self.from_email = settings.DEFAULT_FROM_EMAIL
         self.max_retries = 3
-        self.retry_delay = 5  # seconds
+        self.retry_delay = 0.5  # seconds, doubled after each failed attempt
+        self.max_retry_delay = 30  # seconds
+        self.rate_limit = getattr(settings, 'EMAIL_RATE_LIMIT', 0)
+        self._frontend_url = settings.FRONTEND_URL
+        self._track_prefix = f"{self._frontend_url}/orders/track/"
+        # Context every template receives; fixed for the process lifetime
+        self._default_context = {
+            'company_name': 'Pasargad Prints',
+            'company_url': self._frontend_url,
+            'support_email': 'support@pasargadprints.com',
+        }
         
     def send_email(
         self,
@@ -66,7 +291,8 @@ class EmailService:
         context: Dict[str, Any],
         from_email: Optional[str] = None,
         attachments: Optional[List[tuple]] = None,
-        queue_on_failure: bool = True
+        queue_on_failure: bool = True,
+        idempotency_key: Optional[str] = None
     ) -> bool:
         """
         Send an email using templates with retry logic
@@ -79,23 +305,67 @@ class EmailService:
             from_email: Sender email (optional)
             attachments: List of (filename, content, mimetype) tuples
             queue_on_failure: Whether to queue email if sending fails
+            idempotency_key: Identifies the event being emailed about (e.g.
+                the order id and event); repeats within
+                EMAIL_IDEMPOTENCY_WINDOW are skipped. Without one the email
+                is always sent.
             
         Returns:
             bool: True if email was sent successfully, False otherwise
         """
         try:
-            # Add default context
-            default_context = {
-                'company_name': 'Pasargad Prints',
-                'company_url': settings.FRONTEND_URL,
-                'support_email': 'support@pasargadprints.com',
+            # Add default context without mutating the caller's dict
+            context = {
+                **self._default_context,
                 'current_year': timezone.now().year,
+                **context,
             }
-            context.update(default_context)
             
             # Render templates
-            html_content = render_to_string(f'emails/{template_name}.html', context)
-            plain_content = render_to_string(f'emails/{template_name}.txt', context)
+            html_template, plain_template = _get_email_templates(template_name)
+            html_content = html_template.render(context)
+            plain_content = plain_template.render(context)
+            
+            # Drop repeats of an event email already sent or in flight
+            if idempotency_key:
+                idempotency_key = _email_idempotency_key(template_name, to_email, idempotency_key)
+                if not cache.add(f"email:idem:{idempotency_key}", 1, EMAIL_IDEMPOTENCY_WINDOW):
+                    logger.info(f"Skipping duplicate {template_name} email to {to_email}")
+                    return True
+            
+            from_email = from_email or self.from_email
+            
+            # Over the provider's send rate, park the email in the queue
+            # rather than sending into throttling errors and retry sleeps.
+            # Attachments are not stored on the queue, and callers that opt
+            # out of queuing expect an immediate attempt, so both go inline.
+            if queue_on_failure and not attachments and not self._take_send_token(from_email):
+                logger.info(f"Send rate limit reached, queuing {template_name} email to {to_email}")
+                self._queue_email(
+                    to_email=to_email,
+                    subject=subject,
+                    html_content=html_content,
+                    plain_content=plain_content,
+                    from_email=from_email,
+                    metadata=_email_metadata(template_name, context),
+                    idempotency_key=idempotency_key
+                )
+                return True
+            
+            # Hand the SMTP round trip and its retries to a Celery worker.
+            # Attachments carry raw bytes, which the JSON task serializer
+            # cannot encode, so those are still sent inline.
+            if not attachments and getattr(settings, 'USE_REDIS_CACHE', False):
+                return self._dispatch_email_task(
+                    to_email=to_email,
+                    subject=subject,
+                    html_content=html_content,
+                    plain_content=plain_content,
+                    from_email=from_email,
+                    queue_on_failure=queue_on_failure,
+                    metadata=_email_metadata(template_name, context),
+                    idempotency_key=idempotency_key
+                )
             
             # Send with retry logic
             return self._send_with_retry(
@@ -103,25 +373,129 @@ class EmailService:
                 subject=subject,
                 html_content=html_content,
                 plain_content=plain_content,
-                from_email=from_email or self.from_email,
+                from_email=from_email,
                 attachments=attachments,
                 queue_on_failure=queue_on_failure,
-                metadata={'template': template_name, 'context': context}
+                metadata=_email_metadata(template_name, context),
+                idempotency_key=idempotency_key
             )
             
         except Exception as e:
             logger.error(f"Error preparing email: {str(e)}")
             if queue_on_failure:
+                # Recorded as failed: there is no rendered body, so the queue
+                # sweep must not mail the error text to the recipient
                 self._queue_email(
                     to_email=to_email,
                     subject=subject,
                     html_content="",
-                    plain_content=f"Error rendering template: {str(e)}",
+                    plain_content="",
                     from_email=from_email or self.from_email,
-                    metadata={'template': template_name, 'error': str(e)}
+                    last_error=f"Error rendering template: {str(e)}",
+                    metadata={'template': template_name, 'error': str(e)},
+                    status='failed'
                 )
             return False
     
+    def _take_send_token(self, from_email: str) -> bool:
+        """
+        Count a send against the per-second limit for from_email
+        
+        A fixed one-second window counted with cache.add/incr, which are
+        atomic on Redis so the limit holds across processes.
+        """
+        if not self.rate_limit:
+            return True
+        
+        key = f"email:rate:{from_email}:{int(time.time())}"
+        if cache.add(key, 1, 2):
+            return True
+        try:
+            return cache.incr(key) <= self.rate_limit
+        except ValueError:
+            # The window expired between add and incr
+            return True
+    
+    def _dispatch_email_task(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        plain_content: str,
+        from_email: str,
+        queue_on_failure: bool = True,
+        metadata: Optional[Dict] = None,
+        idempotency_key: Optional[str] = None
+    ) -> bool:
+        """
+        Enqueue a rendered email for delivery by send_email_task
+        
+        Falls back to the EmailQueue table if the broker is unreachable.
+        """
+        from utils.tasks import send_email_task
+        
+        try:
+            send_email_task.delay(
+                to_email=to_email,
+                subject=subject,
+                html_content=html_content,
+                plain_content=plain_content,
+                from_email=from_email,
+                queue_on_failure=queue_on_failure,
+                metadata=metadata,
+                idempotency_key=idempotency_key
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Failed to enqueue email task for {to_email}: {str(e)}")
+            if queue_on_failure:
+                self._queue_email(
+                    to_email=to_email,
+                    subject=subject,
+                    html_content=html_content,
+                    plain_content=plain_content,
+                    from_email=from_email,
+                    last_error=str(e),
+                    metadata=metadata,
+                    idempotency_key=idempotency_key
+                )
+            else:
+                release_email_idempotency_key(idempotency_key)
+            return False
+    
+    def build_message(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        plain_content: str,
+        from_email: str,
+        attachments: Optional[List[tuple]] = None,
+        connection=None
+    ) -> EmailMultiAlternatives:
+        """
+        Build a multipart (plain text + HTML) email message
+        """
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=plain_content,
+            from_email=from_email,
+            to=[to_email],
+            connection=connection
+        )
+        email.attach_alternative(html_content, "text/html")
+        
+        # Add attachments if any
+        if attachments:
+            for filename, content, mimetype in attachments:
+                part = _encode_attachment(filename, content, mimetype)
+                if part is not None:
+                    email.attach(part)
+                else:
+                    email.attach(filename, content, mimetype)
+        
+        return email
+    
     def _send_with_retry(
         self,
         to_email: str,
@@ -131,43 +505,53 @@ class EmailService:
         from_email: str,
         attachments: Optional[List[tuple]] = None,
         queue_on_failure: bool = True,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        idempotency_key: Optional[str] = None
     ) -> bool:
         """
         Send email with retry logic
+        
+        The message is built once and each attempt hands it to the
+        backend's send_messages().
         """
         attempts = 0
         last_error = None
         
-        while attempts < self.max_retries:
-            try:
-                # Create email message
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body=plain_content,
-                    from_email=from_email,
-                    to=[to_email]
-                )
-                email.attach_alternative(html_content, "text/html")
-                
-                # Add attachments if any
-                if attachments:
-                    for filename, content, mimetype in attachments:
-                        email.attach(filename, content, mimetype)
-                
-                # Send email
-                email.send(fail_silently=False)
-                
-                logger.info(f"Email sent successfully to {to_email}")
-                return True
-                
-            except Exception as e:
-                attempts += 1
-                last_error = str(e)
-                logger.warning(f"Email send attempt {attempts} failed: {last_error}")
-                
-                if attempts < self.max_retries:
-                    time.sleep(self.retry_delay)
+        connection = get_connection(fail_silently=False)
+        email = self.build_message(
+            to_email=to_email,
+            subject=subject,
+            html_content=html_content,
+            plain_content=plain_content,
+            from_email=from_email,
+            attachments=attachments,
+            connection=connection
+        )
+        
+        try:
+            while attempts < self.max_retries:
+                try:
+                    if not connection.send_messages([email]):
+                        raise EmailError("Mail backend did not accept the message")
+                    
+                    logger.info(f"Email sent successfully to {to_email}")
+                    return True
+                    
+                except Exception as e:
+                    attempts += 1
+                    last_error = str(e)
+                    logger.warning(f"Email send attempt {attempts} failed: {last_error}")
+                    
+                    # Drop a possibly broken session so the next attempt reconnects
+                    self._close_connection(connection)
+                    
+                    if attempts < self.max_retries:
+                        # Jittered exponential backoff so senders hitting the
+                        # same outage don't retry in lockstep
+                        delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempts)
+                        time.sleep(delay * (0.5 + random.random()))
+        finally:
+            self._close_connection(connection)
         
         # All retries failed
         logger.error(f"Failed to send email to {to_email} after {attempts} attempts")
@@ -180,11 +564,21 @@ class EmailService:
                 plain_content=plain_content,
                 from_email=from_email,
                 last_error=last_error,
-                metadata=metadata
+                metadata=metadata,
+                idempotency_key=idempotency_key
             )
+        else:
+            release_email_idempotency_key(idempotency_key)
         
         return False
     
+    @staticmethod
+    def _close_connection(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+    
     def _queue_email(
         self,
         to_email: str,
@@ -193,12 +587,23 @@ class EmailService:
         plain_content: str,
         from_email: str,
         last_error: Optional[str] = None,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        idempotency_key: Optional[str] = None,
+        status: str = 'pending'
     ):
         """
         Queue email for later processing
+        
+        Rows created with status='failed' are kept as a record only; the
+        queue sweep never sends them.
         """
         try:
+            if idempotency_key and EmailQueue.objects.filter(
+                idempotency_key=idempotency_key, status__in=('pending', 'processing')
+            ).exists():
+                logger.info(f"Email for {to_email} is already queued")
+                return
+            
             EmailQueue.objects.create(
                 to_email=to_email,
                 subject=subject,
@@ -206,63 +611,165 @@ class EmailService:
                 plain_content=plain_content,
                 from_email=from_email,
                 last_error=last_error or "",
-                metadata=metadata or {}
+                metadata=metadata or {},
+                idempotency_key=idempotency_key,
+                status=status
             )
             logger.info(f"Email queued for {to_email}")
         except Exception as e:
             logger.error(f"Failed to queue email: {str(e)}")
     
-    def process_email_queue(self, batch_size: int = 10):
+    def process_email_queue(self, batch_size: int = 50):
         """
         Process pending emails from the queue
+        
+        The whole batch is sent over one SMTP connection, so the TCP, TLS and
+        AUTH handshake is paid once per sweep rather than once per email.
+        
+        Rows are claimed by marking them as processing in a short transaction,
+        and sent after it commits, so no row lock is held during SMTP I/O and
+        concurrent sweeps never pick up the same email.
         """
-        pending_emails = EmailQueue.objects.filter(
-            status='pending',
-            attempts__lt=models.F('max_attempts')
-        ).order_by('created_at')[:batch_size]
+        pending_emails = self._claim_queued_emails(batch_size)
+        if not pending_emails:
+            return
         
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            # Hand the batch back; no attempt is charged for an outage
+            logger.error(f"Could not connect to mail server to process queue: {str(e)}")
+            EmailQueue.objects.filter(pk__in=[item.pk for item in pending_emails]).update(
+                status='pending', claimed_at=None
+            )
+            return
+        
+        try:
+            self._send_queued_batch(pending_emails, connection)
+        finally:
+            connection.close()
+    
+    @staticmethod
+    def _claim_queued_emails(batch_size):
+        """
+        Mark up to batch_size due emails as processing and return them
+        
+        Rows a sweep claimed but never finished with are due again after
+        EMAIL_CLAIM_TIMEOUT.
+        """
+        now = timezone.now()
+        abandoned = models.Q(
+            status='processing',
+            claimed_at__lt=now - timedelta(seconds=EMAIL_CLAIM_TIMEOUT)
+        )
+        with transaction.atomic():
+            claimed = list(
+                EmailQueue.objects.select_for_update(skip_locked=True).filter(
+                    models.Q(status='pending') | abandoned,
+                    attempts__lt=models.F('max_attempts')
+                ).only(
+                    'id', 'to_email', 'subject', 'html_content', 'plain_content',
+                    'from_email', 'status', 'attempts', 'max_attempts'
+                ).order_by('created_at')[:batch_size]
+            )
+            if claimed:
+                EmailQueue.objects.filter(pk__in=[item.pk for item in claimed]).update(
+                    status='processing', claimed_at=now
+                )
+        return claimed
+    
+    def _send_queued_batch(self, pending_emails, connection):
+        """
+        Send a claimed batch over an open connection and record the results
+        
+        Each message goes through connection.send_messages() on the shared
+        session. A single send_messages(batch) call would only report a
+        count, and with fail_silently=False it stops at the first error,
+        so messages are passed one at a time to keep per-row outcomes.
+        """
+        sent_ids = []
+        failed_items = []
+        
+        messages = []
         for email_item in pending_emails:
             email_item.attempts += 1
-            
             try:
-                # Create and send email
-                email = EmailMultiAlternatives(
+                messages.append(self.build_message(
+                    to_email=email_item.to_email,
                     subject=email_item.subject,
-                    body=email_item.plain_content,
+                    html_content=email_item.html_content,
+                    plain_content=email_item.plain_content,
                     from_email=email_item.from_email,
-                    to=[email_item.to_email]
-                )
-                email.attach_alternative(email_item.html_content, "text/html")
-                email.send(fail_silently=False)
-                
-                # Mark as sent
-                email_item.status = 'sent'
-                email_item.sent_at = timezone.now()
-                email_item.save()
+                    connection=connection
+                ))
+            except Exception as e:
+                messages.append(None)
+                self._mark_queued_failure(email_item, e, failed_items)
+        
+        for email_item, email in zip(pending_emails, messages):
+            if email is None:
+                continue
+            
+            try:
+                if not connection.send_messages([email]):
+                    raise EmailError("Mail backend did not accept the message")
                 
+                sent_ids.append(email_item.pk)
                 logger.info(f"Queued email sent to {email_item.to_email}")
                 
             except Exception as e:
-                email_item.last_error = str(e)
-                
-                if email_item.attempts >= email_item.max_attempts:
-                    email_item.status = 'failed'
-                    logger.error(f"Queued email failed permanently: {email_item.to_email}")
-                
-                email_item.save()
+                self._mark_queued_failure(email_item, e, failed_items)
+        
+        # Record the outcome of the whole batch in two statements
+        with transaction.atomic():
+            if sent_ids:
+                EmailQueue.objects.filter(pk__in=sent_ids).update(
+                    status='sent',
+                    sent_at=timezone.now(),
+                    attempts=models.F('attempts') + 1
+                )
+            if failed_items:
+                EmailQueue.objects.bulk_update(
+                    failed_items, ['attempts', 'last_error', 'status'], batch_size=500
+                )
+    
+    @staticmethod
+    def _mark_queued_failure(email_item, error, failed_items):
+        email_item.last_error = str(error)
+        
+        if email_item.attempts >= email_item.max_attempts:
+            email_item.status = 'failed'
+            logger.error(f"Queued email failed permanently: {email_item.to_email}")
+        else:
+            # Release the claim so the next sweep retries it
+            email_item.status = 'pending'
+        
+        failed_items.append(email_item)
+    
+    def _resolve_recipient(self, order):
+        """
+        Return (to_email, customer_name) for an order
+        
+        Registered customers get their account email; guest orders fall back
+        to the billing then shipping contact. A guest order has no user_id,
+        so order.user is None there without a query.
+        """
+        user = order.user
+        if user:
+            return user.email, user.get_full_name() or user.username
+        return (
+            order.billing_email or order.shipping_email,
+            order.billing_name or order.shipping_name or 'Guest',
+        )
     
     def send_order_confirmation(self, order):
         """
         Send order confirmation email
         """
-        # Determine recipient email and name
-        if order.user:
-            to_email = order.user.email
-            customer_name = order.user.get_full_name() or order.user.username
-        else:
-            # Guest order - use billing email
-            to_email = order.billing_email or order.shipping_email
-            customer_name = order.billing_name or order.shipping_name or 'Guest'
+        order = _load_order_for_email(order)
+        
+        to_email, customer_name = self._resolve_recipient(order)
         
         if not to_email:
             logger.error(f"No email address found for order {order.order_number}")
@@ -272,32 +779,31 @@ class EmailService:
             'order': order,
             'order_number': order.order_number,
             'customer_name': customer_name,
-            'order_items': order.items.all(),
+            'order_items': _order_items(order),
             'total_amount': order.total_amount,
             'created_at': order.created_at,
-            'frontend_url': settings.FRONTEND_URL,
+            'frontend_url': self._frontend_url,
             'is_guest': order.user is None,
-            'tracking_url': f"{settings.FRONTEND_URL}/orders/track/{order.order_number}",
+            'tracking_url': f"{self._track_prefix}{order.order_number}",
         }
         
         return self.send_email(
             to_email=to_email,
             subject=f"Order Confirmation - #{order.order_number}",
             template_name='order_confirmation',
-            context=context
+            context=context,
+            idempotency_key=_order_event_key(order, 'confirmation')
         )
     
     def send_order_status_update(self, order, old_status):
         """
         Send order status update email
+        
+        Neither the status update nor the shipped template lists the order
+        items, so unlike the other order emails this does not prefetch them;
+        the only related row read is the customer, by _resolve_recipient.
         """
-        # Determine recipient email and name
-        if order.user:
-            to_email = order.user.email
-            customer_name = order.user.get_full_name() or order.user.username
-        else:
-            to_email = order.billing_email or order.shipping_email
-            customer_name = order.billing_name or order.shipping_name or 'Guest'
+        to_email, customer_name = self._resolve_recipient(order)
         
         if not to_email:
             logger.error(f"No email address found for order {order.order_number}")
@@ -310,9 +816,9 @@ class EmailService:
             'old_status': old_status,
             'new_status': order.status,
             'status_changed_at': timezone.now(),
-            'frontend_url': settings.FRONTEND_URL,
+            'frontend_url': self._frontend_url,
             'is_guest': order.user is None,
-            'tracking_url': f"{settings.FRONTEND_URL}/orders/track/{order.order_number}",
+            'tracking_url': f"{self._track_prefix}{order.order_number}",
         }
         
         # Special handling for shipped status
@@ -340,8 +846,8 @@ class EmailService:
             'user': user,
             'username': user.username,
             'reset_token': reset_token,
-            'reset_url': f"{settings.FRONTEND_URL}/reset-password?token={reset_token}",
-            'frontend_url': settings.FRONTEND_URL,
+            'reset_url': f"{self._frontend_url}/reset-password?token={reset_token}",
+            'frontend_url': self._frontend_url,
         }
         
         return self.send_email(
@@ -355,30 +861,13 @@ class EmailService:
         """
         Send a test email to verify email configuration
         """
-        context = {
-            'test_time': timezone.now(),
-            'recipient': to_email,
-        }
-        
-        # Create simple test content if template doesn't exist
-        html_content = f"""
-        <html>
-            <body>
-                <h2>Test Email from Pasargad Prints</h2>
-                <p>This is a test email sent at {context['test_time']}</p>
-                <p>If you received this email, your email configuration is working correctly!</p>
-                <hr>
-                <p><small>Pasargad Prints - Premium Persian Miniature Art</small></p>
-            </body>
-        </html>
-        """
-        plain_content = strip_tags(html_content)
+        test_time = timezone.now()
         
         return self._send_with_retry(
             to_email=to_email,
             subject="Test Email - Pasargad Prints",
-            html_content=html_content,
-            plain_content=plain_content,
+            html_content=_TEST_HTML.format(test_time=test_time),
+            plain_content=_TEST_PLAIN.format(test_time=test_time),
             from_email=self.from_email,
             queue_on_failure=False
         )
@@ -388,13 +877,10 @@ class EmailService:
         """
         Send order shipped notification email
         """
-        # Determine recipient
-        if order.user:
-            to_email = order.user.email
-            customer_name = order.user.get_full_name() or order.user.username
-        else:
-            to_email = order.billing_email or order.shipping_email
-            customer_name = order.billing_name or order.shipping_name or 'Guest'
+        # The shipped template does not list the items
+        order = _load_order_for_email(order, items=False)
+        
+        to_email, customer_name = self._resolve_recipient(order)
         
         if not to_email:
             logger.error(f"No email address found for order {order.order_number}")
@@ -414,30 +900,27 @@ class EmailService:
                 'postal_code': order.shipping_postal_code,
                 'country': order.shipping_country,
             },
-            'order_items': order.items.all(),
-            'frontend_url': settings.FRONTEND_URL,
+            'order_items': _order_items(order),
+            'frontend_url': self._frontend_url,
             'is_guest': order.user is None,
-            'tracking_url': f"{settings.FRONTEND_URL}/orders/track/{order.order_number}",
+            'tracking_url': f"{self._track_prefix}{order.order_number}",
         }
         
         return self.send_email(
             to_email=to_email,
             subject=f"Your Order #{order.order_number} Has Been Shipped!",
             template_name='order_shipped',
-            context=context
+            context=context,
+            idempotency_key=_order_event_key(order, 'shipped')
         )
     
     def send_order_delivered_notification(self, order):
         """
         Send order delivered notification email
         """
-        # Determine recipient
-        if order.user:
-            to_email = order.user.email
-            customer_name = order.user.get_full_name() or order.user.username
-        else:
-            to_email = order.billing_email or order.shipping_email
-            customer_name = order.billing_name or order.shipping_name or 'Guest'
+        order = _load_order_for_email(order)
+        
+        to_email, customer_name = self._resolve_recipient(order)
         
         if not to_email:
             logger.error(f"No email address found for order {order.order_number}")
@@ -448,24 +931,27 @@ class EmailService:
             'order_number': order.order_number,
             'customer_name': customer_name,
             'delivered_at': order.delivered_at or timezone.now(),
-            'order_items': order.items.all(),
+            'order_items': _order_items(order),
             'total_amount': order.total_amount,
-            'frontend_url': settings.FRONTEND_URL,
+            'frontend_url': self._frontend_url,
             'is_guest': order.user is None,
-            'review_url': f"{settings.FRONTEND_URL}/orders/{order.order_number}/review",
+            'review_url': f"{self._frontend_url}/orders/{order.order_number}/review",
         }
         
         return self.send_email(
             to_email=to_email,
             subject=f"Your Order #{order.order_number} Has Been Delivered!",
             template_name='order_delivered',
-            context=context
+            context=context,
+            idempotency_key=_order_event_key(order, 'delivered')
         )
     
     def send_guest_order_receipt(self, order):
         """
         Send a receipt email to guest customers with tracking information
         """
+        order = _load_order_for_email(order)
+        
         to_email = order.billing_email or order.shipping_email
         if not to_email:
             logger.error(f"No email address found for guest order {order.order_number}")
@@ -475,14 +961,14 @@ class EmailService:
             'order': order,
             'order_number': order.order_number,
             'customer_name': order.billing_name or order.shipping_name or 'Guest',
-            'order_items': order.items.all(),
+            'order_items': _order_items(order),
             'subtotal': order.subtotal,
             'tax_amount': order.tax_amount,
             'shipping_cost': order.shipping_cost,
             'total_amount': order.total_amount,
             'created_at': order.created_at,
-            'frontend_url': settings.FRONTEND_URL,
-            'tracking_url': f"{settings.FRONTEND_URL}/orders/track/guest?order={order.order_number}&email={to_email}",
+            'frontend_url': self._frontend_url,
+            'tracking_url': f"{self._track_prefix}guest?order={order.order_number}&email={to_email}",
             'billing_address': {
                 'name': order.billing_name,
                 'address': order.billing_address,
@@ -505,7 +991,8 @@ class EmailService:
             to_email=to_email,
             subject=f"Your Pasargad Prints Order #{order.order_number}",
             template_name='guest_order_receipt',
-            context=context
+            context=context,
+            idempotency_key=_order_event_key(order, 'receipt')
         )
 
 
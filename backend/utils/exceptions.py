@@ -2,6 +2,7 @@
 Custom exception handlers and error classes for Pasargad Prints
 """
 import logging
+from collections.abc import Mapping
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
 from rest_framework import status
@@ -11,6 +12,19 @@ from django.http import Http404
 
 logger = logging.getLogger(__name__)
 
+# Default messages for common status codes
+_STATUS_MESSAGES = {
+    400: 'Bad request. Please check your input.',
+    401: 'Authentication required. Please log in.',
+    403: 'You do not have permission to perform this action.',
+    404: 'The requested resource was not found.',
+    405: 'Method not allowed.',
+    409: 'Conflict. The resource already exists or cannot be modified.',
+    429: 'Too many requests. Please slow down.',
+    500: 'Internal server error. Please try again later.',
+    503: 'Service temporarily unavailable. Please try again later.',
+}
+
 
 def custom_exception_handler(exc, context):
     """
@@ -23,6 +37,7 @@ def custom_exception_handler(exc, context):
     # Get request information for logging
     request = context.get('request')
     view = context.get('view')
+    user = getattr(request, 'user', None) if request else None
     
     # Log the exception with context
     logger.error(
@@ -31,7 +46,7 @@ def custom_exception_handler(exc, context):
         extra={
             'request_method': request.method if request else None,
             'request_path': request.path if request else None,
-            'request_user': request.user.id if request and hasattr(request, 'user') and request.user.is_authenticated else None,
+            'request_user': user.id if user is not None and user.is_authenticated else None,
         }
     )
     
@@ -45,9 +60,9 @@ def custom_exception_handler(exc, context):
         }
         
         # Add field errors if available
-        if hasattr(response, 'data') and isinstance(response.data, dict):
-            if 'detail' not in response.data:
-                custom_response_data['errors'] = response.data
+        data = getattr(response, 'data', None)
+        if isinstance(data, Mapping) and 'detail' not in data:
+            custom_response_data['errors'] = data
             
         response.data = custom_response_data
     else:
@@ -89,26 +104,15 @@ def _get_error_message(exc, response):
     """
     Extract a user-friendly error message from the exception
     """
-    if hasattr(response, 'data'):
-        if isinstance(response.data, dict) and 'detail' in response.data:
-            return str(response.data['detail'])
-        elif isinstance(response.data, list) and response.data:
-            return str(response.data[0])
-    
-    # Default messages for common status codes
-    status_messages = {
-        400: 'Bad request. Please check your input.',
-        401: 'Authentication required. Please log in.',
-        403: 'You do not have permission to perform this action.',
-        404: 'The requested resource was not found.',
-        405: 'Method not allowed.',
-        409: 'Conflict. The resource already exists or cannot be modified.',
-        429: 'Too many requests. Please slow down.',
-        500: 'Internal server error. Please try again later.',
-        503: 'Service temporarily unavailable. Please try again later.',
-    }
+    data = getattr(response, 'data', None)
+    if isinstance(data, Mapping):
+        detail = data.get('detail')
+        if detail is not None:
+            return str(detail)
+    elif isinstance(data, list) and data:
+        return str(data[0])
     
-    return status_messages.get(
+    return _STATUS_MESSAGES.get(
         response.status_code,
         f'Error {response.status_code}: {exc.__class__.__name__}'
     )
@@ -131,4 +135,8 @@ class InvalidOrderStateError(Exception):
 
 class EmailError(Exception):
     """Base exception for email-related errors"""
-    pass
\ No newline at end of file
+    pass
+
+class LockAcquisitionError(Exception):
+    """Raised when a function guarded by require_lock is already running"""
+    pass
@@ -6,16 +6,50 @@ API Reference: https://docs.goshippo.com/docs/api
 """
 import logging
 import json
-from django.utils.deprecation import MiddlewareMixin
-from django.http import JsonResponse
+import re
+from django.http import HttpResponse, JsonResponse
 from django.conf import settings
 from django.core.cache import cache
-import shippo
+from utils.middleware import HybridMiddleware
+from utils.goshippo_service import (
+    json_dumps_sorted, new_cache_hasher, rates_l1_get, rates_l1_set, shippo_client,
+    utc_now_iso,
+)
+
+# Optional imports
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
 
-class GoshippoAuthenticationMiddleware(MiddlewareMixin):
+def _json_loads(data):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _is_json_response(response):
+    """Return whether a response is JSON, remembered on the response for later middleware"""
+    is_json = getattr(response, '_goshippo_is_json', None)
+    if is_json is None:
+        is_json = response.get('Content-Type', '').startswith('application/json')
+        response._goshippo_is_json = is_json
+    return is_json
+
+class GoshippoMiddleware(HybridMiddleware):
+    """
+    Base class for the Goshippo middleware, usable under WSGI and ASGI.
+    
+    The async path runs the hooks on the event loop, so process_request and
+    process_response must not block; see HybridMiddleware.
+    """
+
+
+class GoshippoAuthenticationMiddleware(GoshippoMiddleware):
     """
     Middleware to handle Goshippo authentication for shipping API requests.
     Authenticates requests to shipping endpoints using Goshippo test API key.
@@ -29,25 +63,39 @@ class GoshippoAuthenticationMiddleware(MiddlewareMixin):
         '/api/shipping/tracking/',
     ]
     
+    # Set on every shipping response
+    _STATIC_HEADERS = (
+        ('X-Shipping-Provider', 'Goshippo'),
+        ('X-Shipping-API-Version', '2018-02-08'),
+    )
+    
     def __init__(self, get_response):
         super().__init__(get_response)
-        # Initialize Goshippo client with test API key
-        self.goshippo_client = shippo.Shippo(
-            security=security.Security(
-                api_key_header=getattr(settings, 'GOSHIPPO_API_KEY', 'shippo_test_a273c78ecb97dae87d34dbec6c37cef303c80d15')
-            )
-        )
+        # One anchored regex instead of a startswith() per path
+        self._shipping_re = re.compile('|'.join(re.escape(path) for path in self.SHIPPING_PATHS))
+        self.api_key = getattr(settings, 'GOSHIPPO_API_KEY', 'shippo_test_a273c78ecb97dae87d34dbec6c37cef303c80d15')
+    
+    @property
+    def goshippo_client(self):
+        """Shared Goshippo client, created on the first shipping request"""
+        return shippo_client(self.api_key)
         
     def process_request(self, request):
         """Process incoming requests to shipping endpoints."""
-        # Check if this is a shipping-related request
-        if any(request.path.startswith(path) for path in self.SHIPPING_PATHS):
-            # Add Goshippo client to request for use in views
-            request.goshippo_client = self.goshippo_client
-            
-            # Log shipping API request
+        # Most traffic is not shipping; flag it so every Goshippo
+        # middleware can bail out on one attribute read
+        if self._shipping_re.match(request.path) is None:
+            request._goshippo = False
+            return None
+        
+        # Add Goshippo client to request for use in views
+        request.goshippo_client = self.goshippo_client
+        request._goshippo = True
+        
+        # Log shipping API request
+        if logger.isEnabledFor(logging.INFO):
             logger.info(
-                f"Goshippo API request: {request.method} {request.path}",
+                "Goshippo API request: %s %s", request.method, request.path,
                 extra={
                     'request_id': getattr(request, 'id', 'unknown'),
                     'method': request.method,
@@ -61,29 +109,31 @@ class GoshippoAuthenticationMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         """Process responses from shipping endpoints."""
         # Add Goshippo headers to shipping responses
-        if hasattr(request, 'goshippo_client') and any(request.path.startswith(path) for path in self.SHIPPING_PATHS):
-            response['X-Shipping-Provider'] = 'Goshippo'
-            response['X-Shipping-API-Version'] = '2018-02-08'
+        if getattr(request, '_goshippo', False):
+            for header, value in self._STATIC_HEADERS:
+                response[header] = value
             
             # Log shipping API response
-            logger.info(
-                f"Goshippo API response: {request.method} {request.path} - Status: {response.status_code}",
-                extra={
-                    'request_id': getattr(request, 'id', 'unknown'),
-                    'method': request.method,
-                    'path': request.path,
-                    'status_code': response.status_code,
-                    'goshippo_enabled': True,
-                }
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Goshippo API response: %s %s - Status: %s",
+                    request.method, request.path, response.status_code,
+                    extra={
+                        'request_id': getattr(request, 'id', 'unknown'),
+                        'method': request.method,
+                        'path': request.path,
+                        'status_code': response.status_code,
+                        'goshippo_enabled': True,
+                    }
+                )
         
         return response
     
     def process_exception(self, request, exception):
         """Handle Goshippo SDK exceptions."""
-        if hasattr(request, 'goshippo_client') and isinstance(exception, SDKError):
+        if getattr(request, '_goshippo', False) and isinstance(exception, SDKError):
             logger.error(
-                f"Goshippo SDK error: {request.method} {request.path} - {str(exception)}",
+                "Goshippo SDK error: %s %s - %s", request.method, request.path, exception,
                 exc_info=True,
                 extra={
                     'request_id': getattr(request, 'id', 'unknown'),
@@ -104,121 +154,178 @@ class GoshippoAuthenticationMiddleware(MiddlewareMixin):
         return None
 
 
-class GoshippoRequestProcessingMiddleware(MiddlewareMixin):
+class GoshippoRequestProcessingMiddleware(GoshippoMiddleware):
     """
     Middleware to process and validate Goshippo shipping requests and responses.
-    Handles request/response transformation and caching.
+    Handles request/response transformation, response standardization and
+    caching.
+    
+    The cache here holds whole /api/shipping/rates/ responses. It is kept
+    apart from GoshippoShippingService's rates cache, which stores service
+    results for the order shipping views: those live on other paths, take
+    their origin from settings rather than the body, and save the shipment
+    id on the order, so a shared entry would skip that write.
     """
     
     CACHE_PREFIX = 'goshippo_cache'
     CACHE_TIMEOUT = 300  # 5 minutes
+    # Request fields that identify a rates quote, with their defaults
+    CACHE_KEY_FIELDS = (
+        ('from_address', {}),
+        ('to_address', {}),
+        ('parcel', {}),
+        ('carrier_accounts', []),
+    )
+    # Standard shipping response headers
+    _STATIC_HEADERS = (
+        ('X-Shipping-Provider', 'Goshippo'),
+        ('X-API-Version', '2018-02-08'),
+    )
     
     def process_request(self, request):
         """Process and validate shipping requests."""
-        if not hasattr(request, 'goshippo_client'):
+        cache_key = self._rates_cache_key(request)
+        if cache_key is None:
             return None
-            
-        # Cache shipping rates requests
-        if request.path.startswith('/api/shipping/rates/') and request.method == 'POST':
-            cache_key = self._generate_cache_key(request)
-            cached_rates = cache.get(cache_key)
-            
-            if cached_rates:
-                logger.info(f"Cache hit for shipping rates request: {cache_key}")
-                response = JsonResponse(cached_rates)
-                response['X-Cache'] = 'HIT'
-                response['X-Shipping-Provider'] = 'Goshippo'
-                return response
-            
-            # Store cache key for response processing
-            request._goshippo_cache_key = cache_key
-        
-        return None
+        cached_rates = rates_l1_get(cache_key)
+        if cached_rates:
+            return self._rates_cache_hit(request, cache_key, cached_rates, 'HIT-L1')
+        return self._rates_cache_hit(request, cache_key, cache.get(cache_key), 'HIT-L2')
+    
+    async def aprocess_request(self, request):
+        cache_key = self._rates_cache_key(request)
+        if cache_key is None:
+            return None
+        cached_rates = rates_l1_get(cache_key)
+        if cached_rates:
+            return self._rates_cache_hit(request, cache_key, cached_rates, 'HIT-L1')
+        return self._rates_cache_hit(request, cache_key, await cache.aget(cache_key), 'HIT-L2')
     
     def process_response(self, request, response):
-        """Process and cache shipping responses."""
-        if not hasattr(request, 'goshippo_client'):
+        """Standardize and cache shipping responses."""
+        if not getattr(request, '_goshippo', False):
             return response
-            
-        # Cache successful shipping rates responses
-        if (hasattr(request, '_goshippo_cache_key') and 
-            response.status_code == 200 and 
-            response.get('Content-Type', '').startswith('application/json')):
-            
+        self._standardize_response(response)
+        data = self._rates_to_cache(request, response)
+        if data is not None:
             try:
-                # Parse and cache response data
-                if hasattr(response, 'data'):
-                    data = response.data
-                else:
-                    data = json.loads(response.content)
-                
                 cache.set(request._goshippo_cache_key, data, timeout=self.CACHE_TIMEOUT)
-                response['X-Cache'] = 'MISS'
-                logger.info(f"Cached shipping rates response: {request._goshippo_cache_key}")
-                
             except Exception as e:
-                logger.warning(f"Failed to cache shipping response: {e}")
-        
+                logger.warning("Failed to cache shipping response: %s", e)
+            else:
+                self._mark_rates_cached(request, response)
         return response
     
-    def _generate_cache_key(self, request):
-        """Generate cache key for shipping requests."""
-        try:
-            # Create cache key from request data
-            request_data = json.loads(request.body) if request.body else {}
-            
-            # Create a hash of relevant shipping parameters
-            import hashlib
-            
-            cache_data = {
-                'from_address': request_data.get('from_address', {}),
-                'to_address': request_data.get('to_address', {}),
-                'parcel': request_data.get('parcel', {}),
-                'carrier_accounts': request_data.get('carrier_accounts', []),
-            }
-            
-            cache_string = json.dumps(cache_data, sort_keys=True)
-            cache_hash = hashlib.md5(cache_string.encode()).hexdigest()
-            
-            return f"{self.CACHE_PREFIX}_rates_{cache_hash}"
-            
-        except Exception as e:
-            logger.warning(f"Failed to generate cache key: {e}")
-            return f"{self.CACHE_PREFIX}_rates_fallback"
-
-
-class GoshippoResponseProcessingMiddleware(MiddlewareMixin):
-    """
-    Middleware to process and transform Goshippo API responses.
-    Handles response standardization and error handling.
-    """
-    
-    def process_response(self, request, response):
-        """Standardize Goshippo API responses."""
-        if not hasattr(request, 'goshippo_client'):
+    async def aprocess_response(self, request, response):
+        if not getattr(request, '_goshippo', False):
             return response
-            
+        self._standardize_response(response)
+        data = self._rates_to_cache(request, response)
+        if data is not None:
+            try:
+                await cache.aset(request._goshippo_cache_key, data, timeout=self.CACHE_TIMEOUT)
+            except Exception as e:
+                logger.warning("Failed to cache shipping response: %s", e)
+            else:
+                self._mark_rates_cached(request, response)
+        return response
+    
+    def _standardize_response(self, response):
         # Add standard shipping response headers
-        response['X-Shipping-Provider'] = 'Goshippo'
-        response['X-API-Version'] = '2018-02-08'
+        for header, value in self._STATIC_HEADERS:
+            response[header] = value
         
         # Transform response format if needed
         if (response.status_code == 200 and 
-            response.get('Content-Type', '').startswith('application/json')):
+            _is_json_response(response)):
             
             try:
                 # Add metadata to successful responses
                 if hasattr(response, 'data') and isinstance(response.data, dict):
                     response.data['provider'] = 'goshippo'
                     response.data['api_version'] = '2018-02-08'
-                    response.data['timestamp'] = self._get_timestamp()
+                    response.data['timestamp'] = utc_now_iso()
                     
             except Exception as e:
-                logger.warning(f"Failed to transform response: {e}")
+                logger.warning("Failed to transform response: %s", e)
+    
+    def _rates_cache_key(self, request):
+        """Return the cache key for a shipping rates request, or None"""
+        if not getattr(request, '_goshippo', False):
+            return None
+        # Cache shipping rates requests
+        if request.path.startswith('/api/shipping/rates/') and request.method == 'POST':
+            return self._generate_cache_key(request)
+        return None
+    
+    def _rates_cache_hit(self, request, cache_key, cached_rates, cache_status):
+        if cached_rates:
+            logger.info("Cache hit for shipping rates request: %s", cache_key)
+            if cache_status != 'HIT-L1':
+                rates_l1_set(cache_key, cached_rates)
+            headers = {'X-Cache': cache_status, 'X-Shipping-Provider': 'Goshippo'}
+            if isinstance(cached_rates, bytes):
+                return HttpResponse(cached_rates, content_type='application/json', headers=headers)
+            # Entry written before bodies were cached as bytes
+            return JsonResponse(cached_rates, headers=headers)
         
-        return response
+        # Store cache key for response processing
+        request._goshippo_cache_key = cache_key
+        return None
     
-    def _get_timestamp(self):
-        """Get current timestamp in ISO format."""
-        from datetime import datetime
-        return datetime.utcnow().isoformat() + 'Z'
\ No newline at end of file
+    def _rates_to_cache(self, request, response):
+        """
+        Return the body of a successful rates response to cache, or None
+        
+        The rendered JSON bytes are cached as-is and replayed on a hit, so
+        the body is neither parsed here nor re-serialized when served.
+        """
+        if response.streaming:
+            return None
+        
+        # Cache successful shipping rates responses
+        if (hasattr(request, '_goshippo_cache_key') and 
+            response.status_code == 200 and 
+            _is_json_response(response)):
+            
+            try:
+                return response.content
+            except Exception as e:
+                logger.warning("Failed to cache shipping response: %s", e)
+        return None
+    
+    def _mark_rates_cached(self, request, response):
+        rates_l1_set(request._goshippo_cache_key, response.content)
+        response['X-Cache'] = 'MISS'
+        logger.info("Cached shipping rates response: %s", request._goshippo_cache_key)
+    
+    def _generate_cache_key(self, request):
+        """
+        Generate cache key for shipping requests.
+        
+        The body is read through request.body on purpose: Django keeps it
+        on the request and DRF parses the view's data from that same
+        buffer, so reading it here does not add a copy. Streaming it
+        would leave the view with an exhausted stream.
+        """
+        try:
+            # Create cache key from request data
+            body = request.body
+            request_data = _json_loads(body) if body else {}
+            
+            if not isinstance(request_data, dict):
+                raise ValueError("rates request body is not a JSON object")
+            
+            # Only the quote fields are re-serialized, each fed to the
+            # hasher separately; the rest of the body is never touched
+            hasher = new_cache_hasher()
+            for field, default in self.CACHE_KEY_FIELDS:
+                hasher.update(json_dumps_sorted(request_data.get(field, default)))
+                hasher.update(b'|')
+            cache_hash = hasher.hexdigest()
+            
+            return f"{self.CACHE_PREFIX}_rates_{cache_hash}"
+            
+        except Exception as e:
+            logger.warning("Failed to generate cache key: %s", e)
+            return f"{self.CACHE_PREFIX}_rates_fallback"
\ No newline at end of file
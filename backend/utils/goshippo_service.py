@@ -5,15 +5,122 @@ Handles shipping rates, labels, and tracking through Goshippo API.
 Documentation: https://github.com/goshippo/shippo-python-sdk
 API Reference: https://docs.goshippo.com/docs/api
 """
+import hashlib
+import json
 import logging
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
 from django.conf import settings
 from django.core.cache import cache
 import shippo
-from shippo import security
+
+# Optional imports
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from cachetools import TTLCache
+    CACHETOOLS_AVAILABLE = True
+except ImportError:
+    CACHETOOLS_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# In-process L1 for rate lookups in front of the shared cache; a few
+# origin/destination pairs account for most requests
+RATES_L1_MAXSIZE = 512
+RATES_L1_TTL = 60  # seconds
+
+_rates_l1 = TTLCache(maxsize=RATES_L1_MAXSIZE, ttl=RATES_L1_TTL) if CACHETOOLS_AVAILABLE else None
+_rates_l1_lock = threading.Lock()
+
+
+def rates_l1_get(key):
+    if _rates_l1 is None:
+        return None
+    with _rates_l1_lock:
+        return _rates_l1.get(key)
+
+
+def rates_l1_set(key, value):
+    if _rates_l1 is not None:
+        with _rates_l1_lock:
+            _rates_l1[key] = value
+
+
+# (epoch second, ISO string) of the last timestamp handed out
+_last_timestamp = (0, '')
+
+
+def utc_now_iso():
+    """
+    Current UTC time as an ISO 8601 string, to the second
+    
+    The string is only re-formatted when the second changes, since
+    shipping results and responses don't need sub-second stamps.
+    """
+    global _last_timestamp
+    now = int(time.time())
+    cached = _last_timestamp
+    if cached[0] != now:
+        cached = (now, datetime.fromtimestamp(now, timezone.utc).isoformat())
+        _last_timestamp = cached
+    return cached[1]
+
+
+@lru_cache(maxsize=1)
+def shippo_client(api_key):
+    """Return the Goshippo SDK client for api_key, shared by all callers"""
+    return shippo.Shippo(api_key_header=api_key)
+
+
+def _location(location):
+    """City/state/zip/country of a Goshippo tracking location, or None"""
+    if not location:
+        return None
+    return {
+        'city': location.city,
+        'state': location.state,
+        'zip': location.zip,
+        'country': location.country,
+    }
+
+
+if ORJSON_AVAILABLE:
+    def json_dumps_sorted(value):
+        """Serialize to canonical JSON bytes (sorted keys) for hashing"""
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+else:
+    def json_dumps_sorted(value):
+        """
+        Serialize to canonical JSON bytes (sorted keys) for hashing
+        
+        Compact and non-ASCII-escaping like orjson, so hosts with and
+        without orjson compute the same cache keys.
+        """
+        return json.dumps(
+            value, sort_keys=True, separators=(',', ':'), ensure_ascii=False
+        ).encode('utf-8')
+
+
+def new_cache_hasher():
+    """
+    Return a hasher for Goshippo cache keys
+    
+    BLAKE2b with a 16-byte digest by default, which keeps keys the same
+    length as the MD5 keys they replace. GOSHIPPO_CACHE_HASH selects any
+    other hashlib algorithm.
+    """
+    algorithm = getattr(settings, 'GOSHIPPO_CACHE_HASH', 'blake2b')
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
 
 class GoshippoShippingService:
     """
@@ -25,15 +132,15 @@ class GoshippoShippingService:
         """Initialize Goshippo client with API key."""
         self.api_key = getattr(settings, 'GOSHIPPO_API_KEY', 'shippo_test_a273c78ecb97dae87d34dbec6c37cef303c80d15')
         
-        self.client = shippo.Shippo(
-            security=security.Security(
-                api_key_header=self.api_key
-            )
-        )
-        
         # Cache settings
         self.cache_prefix = 'goshippo_service'
         self.cache_timeout = 300  # 5 minutes
+        self.error_cache_timeout = 30  # failed rate lookups
+    
+    @property
+    def client(self):
+        """Goshippo client, created on first use rather than at import"""
+        return shippo_client(self.api_key)
         
     def get_shipping_rates(self, from_address, to_address, parcel_details, carrier_accounts=None):
         """
@@ -48,15 +155,29 @@ class GoshippoShippingService:
         Returns:
             dict: Shipping rates and options
         """
+        error_key = None
         try:
-            # Create cache key
-            cache_key = self._generate_rates_cache_key(from_address, to_address, parcel_details)
-            cached_rates = cache.get(cache_key)
+            # Create cache keys; failures are cached briefly under their own
+            # key so repeated bad requests don't all reach Goshippo
+            cache_key, error_key = self._generate_rates_cache_keys(from_address, to_address, parcel_details)
+            cached_rates = rates_l1_get(cache_key)
+            if cached_rates:
+                logger.info("L1 cache hit for shipping rates: %s", cache_key)
+                return cached_rates
             
+            cached = cache.get_many([cache_key, error_key])
+            
+            cached_rates = cached.get(cache_key)
             if cached_rates:
-                logger.info(f"Cache hit for shipping rates: {cache_key}")
+                logger.info("Cache hit for shipping rates: %s", cache_key)
+                rates_l1_set(cache_key, cached_rates)
                 return cached_rates
             
+            cached_error = cached.get(error_key)
+            if cached_error:
+                logger.info("Cached failure for shipping rates: %s", error_key)
+                return cached_error
+            
             # Create addresses
             from_addr = addressfrom.AddressFrom(
                 name=from_address.get('name', 'Pasargad Prints'),
@@ -112,9 +233,8 @@ class GoshippoShippingService:
             shipment_data = response.shipment
             
             # Process rates
-            rates_data = []
-            for rate_obj in shipment_data.rates:
-                rate_data = {
+            rates_data = [
+                {
                     'rate_id': rate_obj.object_id,
                     'carrier': rate_obj.provider,
                     'service': rate_obj.servicelevel.name,
@@ -126,27 +246,37 @@ class GoshippoShippingService:
                     'carrier_account': rate_obj.carrier_account,
                     'test': rate_obj.test,
                 }
-                rates_data.append(rate_data)
+                for rate_obj in shipment_data.rates
+            ]
             
             result = {
                 'shipment_id': shipment_data.object_id,
                 'rates': rates_data,
                 'status': 'success',
-                'timestamp': datetime.utcnow().isoformat(),
+                'timestamp': utc_now_iso(),
             }
             
             # Cache the results
             cache.set(cache_key, result, timeout=self.cache_timeout)
+            rates_l1_set(cache_key, result)
             
-            logger.info(f"Retrieved {len(rates_data)} shipping rates")
+            logger.info("Retrieved %s shipping rates", len(rates_data))
             return result
             
         except SDKError as e:
-            logger.error(f"Goshippo SDK error getting rates: {e}")
-            return {'error': str(e), 'status': 'error'}
+            logger.error("Goshippo SDK error getting rates: %s", e)
+            return self._cache_rates_error(error_key, {'error': str(e), 'status': 'error'})
         except Exception as e:
-            logger.error(f"Unexpected error getting rates: {e}")
-            return {'error': 'Failed to get shipping rates', 'status': 'error'}
+            logger.error("Unexpected error getting rates: %s", e)
+            return self._cache_rates_error(error_key, {'error': 'Failed to get shipping rates', 'status': 'error'})
+    
+    def _cache_rates_error(self, error_key, result):
+        if error_key is not None:
+            try:
+                cache.set(error_key, result, timeout=self.error_cache_timeout)
+            except Exception as e:
+                logger.warning("Failed to cache shipping rates error: %s", e)
+        return result
     
     def create_shipping_label(self, rate_id, label_format='PDF'):
         """
@@ -186,17 +316,17 @@ class GoshippoShippingService:
                 'amount': float(transaction_data.rate.amount),
                 'currency': transaction_data.rate.currency,
                 'test': transaction_data.test,
-                'timestamp': datetime.utcnow().isoformat(),
+                'timestamp': utc_now_iso(),
             }
             
-            logger.info(f"Created shipping label: {transaction_data.tracking_number}")
+            logger.info("Created shipping label: %s", transaction_data.tracking_number)
             return result
             
         except SDKError as e:
-            logger.error(f"Goshippo SDK error creating label: {e}")
+            logger.error("Goshippo SDK error creating label: %s", e)
             return {'error': str(e), 'status': 'error'}
         except Exception as e:
-            logger.error(f"Unexpected error creating label: {e}")
+            logger.error("Unexpected error creating label: %s", e)
             return {'error': 'Failed to create shipping label', 'status': 'error'}
     
     def track_shipment(self, tracking_number, carrier=None):
@@ -220,20 +350,15 @@ class GoshippoShippingService:
             tracking_data = response.track
             
             # Process tracking history
-            tracking_history = []
-            for status in tracking_data.tracking_history:
-                history_item = {
+            tracking_history = [
+                {
                     'status': status.status,
                     'status_date': status.status_date,
                     'status_details': status.status_details,
-                    'location': {
-                        'city': status.location.city if status.location else None,
-                        'state': status.location.state if status.location else None,
-                        'zip': status.location.zip if status.location else None,
-                        'country': status.location.country if status.location else None,
-                    } if status.location else None,
+                    'location': _location(status.location),
                 }
-                tracking_history.append(history_item)
+                for status in tracking_data.tracking_history
+            ]
             
             result = {
                 'tracking_number': tracking_data.tracking_number,
@@ -242,30 +367,20 @@ class GoshippoShippingService:
                 'eta': tracking_data.eta,
                 'original_eta': tracking_data.original_eta,
                 'tracking_history': tracking_history,
-                'address_from': {
-                    'city': tracking_data.address_from.city if tracking_data.address_from else None,
-                    'state': tracking_data.address_from.state if tracking_data.address_from else None,
-                    'zip': tracking_data.address_from.zip if tracking_data.address_from else None,
-                    'country': tracking_data.address_from.country if tracking_data.address_from else None,
-                } if tracking_data.address_from else None,
-                'address_to': {
-                    'city': tracking_data.address_to.city if tracking_data.address_to else None,
-                    'state': tracking_data.address_to.state if tracking_data.address_to else None,
-                    'zip': tracking_data.address_to.zip if tracking_data.address_to else None,
-                    'country': tracking_data.address_to.country if tracking_data.address_to else None,
-                } if tracking_data.address_to else None,
+                'address_from': _location(tracking_data.address_from),
+                'address_to': _location(tracking_data.address_to),
                 'test': tracking_data.test,
-                'timestamp': datetime.utcnow().isoformat(),
+                'timestamp': utc_now_iso(),
             }
             
-            logger.info(f"Retrieved tracking info for: {tracking_number}")
+            logger.info("Retrieved tracking info for: %s", tracking_number)
             return result
             
         except SDKError as e:
-            logger.error(f"Goshippo SDK error tracking shipment: {e}")
+            logger.error("Goshippo SDK error tracking shipment: %s", e)
             return {'error': str(e), 'status': 'error'}
         except Exception as e:
-            logger.error(f"Unexpected error tracking shipment: {e}")
+            logger.error("Unexpected error tracking shipment: %s", e)
             return {'error': 'Failed to track shipment', 'status': 'error'}
     
     def validate_address(self, address_data):
@@ -316,34 +431,32 @@ class GoshippoShippingService:
                     'phone': address_obj.phone,
                     'email': address_obj.email,
                 },
-                'timestamp': datetime.utcnow().isoformat(),
+                'timestamp': utc_now_iso(),
             }
             
-            logger.info(f"Validated address: {address_obj.validation_results.is_valid}")
+            logger.info("Validated address: %s", address_obj.validation_results.is_valid)
             return result
             
         except SDKError as e:
-            logger.error(f"Goshippo SDK error validating address: {e}")
+            logger.error("Goshippo SDK error validating address: %s", e)
             return {'error': str(e), 'status': 'error'}
         except Exception as e:
-            logger.error(f"Unexpected error validating address: {e}")
+            logger.error("Unexpected error validating address: %s", e)
             return {'error': 'Failed to validate address', 'status': 'error'}
     
-    def _generate_rates_cache_key(self, from_address, to_address, parcel_details):
-        """Generate cache key for rates request."""
-        import hashlib
-        import json
-        
-        cache_data = {
-            'from': from_address,
-            'to': to_address,
-            'parcel': parcel_details,
-        }
+    def _generate_rates_cache_keys(self, from_address, to_address, parcel_details):
+        """Generate the result and error cache keys for a rates request."""
+        # Hash each part separately rather than building one joined string
+        hasher = new_cache_hasher()
+        for part in (from_address, to_address, parcel_details):
+            hasher.update(json_dumps_sorted(part))
+            hasher.update(b'|')
+        cache_hash = hasher.hexdigest()
         
-        cache_string = json.dumps(cache_data, sort_keys=True)
-        cache_hash = hashlib.md5(cache_string.encode()).hexdigest()
-        
-        return f"{self.cache_prefix}_rates_{cache_hash}"
+        return (
+            f"{self.cache_prefix}_rates_{cache_hash}",
+            f"{self.cache_prefix}_rates_err_{cache_hash}",
+        )
 
 
 # Global service instance
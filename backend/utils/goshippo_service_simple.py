@@ -3,19 +3,29 @@ Simple Goshippo shipping service using correct SDK
 """
 import shippo
 from django.conf import settings
+from functools import lru_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=None)
+def _shippo_client(api_key):
+    """One SDK client per API key, instead of setting a process-wide key"""
+    return shippo.Shippo(api_key_header=api_key)
+
 class SimpleGoshippoService:
     def __init__(self):
         self.api_key = getattr(settings, 'GOSHIPPO_API_KEY', 'shippo_test_a273c78ecb97dae87d34dbec6c37cef303c80d15')
-        shippo.api_key = self.api_key
+    
+    @property
+    def client(self):
+        return _shippo_client(self.api_key)
     
     def test_connection(self):
         """Test if we can connect to Goshippo API"""
         try:
-            # Simple test - this should work if API key is valid
+            # Simple test - building the shared client touches no global state
+            self.client
             return {"status": "success", "message": "API key configured"}
         except Exception as e:
             return {"status": "error", "message": str(e)}
@@ -0,0 +1,131 @@
+"""
+Background log writing for Pasargad Prints
+
+Configured loggers get a QueueHandler in place of their handlers, and the
+original handlers are driven from a QueueListener thread, so a request
+thread only enqueues the record and never waits on console or file I/O.
+"""
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.log import AdminEmailHandler
+
+# Most records a listener takes off its queue before flushing its handlers
+BATCH_SIZE = 64
+
+# (QueueHandler, handlers) for every listener, kept to restart them after a fork
+_queues = []
+_listeners = []
+
+
+def _skip_flush():
+    pass
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    QueueListener that writes whatever has queued up as one batch
+
+    Stream and file handlers normally flush after every record. Here the
+    listener takes up to BATCH_SIZE waiting records, emits them with
+    flushing switched off, then flushes each handler once. It never waits
+    for a batch to fill, so a lone record is written straight away.
+    """
+
+    def _monitor(self):
+        log_queue = self.queue
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = self._sentinel in batch
+            if stop:
+                batch = batch[:batch.index(self._sentinel)]
+            if batch:
+                self._handle_batch(batch)
+            if stop:
+                break
+
+    def _handle_batch(self, records):
+        # Handlers can be shared with other listeners, so hold their locks
+        # (in a fixed order) while flush is switched off
+        handlers = sorted(self.handlers, key=id)
+        for handler in handlers:
+            handler.acquire()
+        try:
+            streams = [handler for handler in handlers if isinstance(handler, logging.StreamHandler)]
+            for handler in streams:
+                handler.flush = _skip_flush
+            try:
+                for record in records:
+                    self.handle(record)
+            finally:
+                for handler in streams:
+                    del handler.flush
+                    handler.flush()
+        finally:
+            for handler in reversed(handlers):
+                handler.release()
+
+
+def start_queued_logging(logger_names):
+    """
+    Route the named loggers ('' is the root logger) through queue listeners
+
+    Loggers sharing the same handlers share one queue and listener, so each
+    record is still written once per handler. Loggers with an
+    AdminEmailHandler are left alone: it needs the live exc_info and
+    request, which QueueHandler.prepare() drops. Calling this again is a
+    no-op.
+    """
+    if _queues:
+        return
+
+    queue_handlers = {}
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        handlers = tuple(logger.handlers)
+        if not handlers or any(isinstance(handler, AdminEmailHandler) for handler in handlers):
+            continue
+
+        queue_handler = queue_handlers.get(handlers)
+        if queue_handler is None:
+            queue_handler = queue_handlers[handlers] = QueueHandler(queue.SimpleQueue())
+            _queues.append((queue_handler, handlers))
+        logger.handlers = [queue_handler]
+
+    if _queues:
+        _start_listeners()
+        atexit.register(stop_queued_logging)
+        # Listener threads don't survive a fork (preforking servers and
+        # Celery workers), so each child starts its own
+        os.register_at_fork(after_in_child=_restart_listeners)
+
+
+def _start_listeners():
+    for queue_handler, handlers in _queues:
+        listener = BatchingQueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+
+
+def _restart_listeners():
+    # The inherited queues may hold the parent's pending records and a lock
+    # taken by its listener thread, so the child gets fresh ones
+    _listeners.clear()
+    for queue_handler, _ in _queues:
+        queue_handler.queue = queue.SimpleQueue()
+    _start_listeners()
+
+
+def stop_queued_logging():
+    """Write out any queued records and stop the listener threads"""
+    while _listeners:
+        _listeners.pop().stop()
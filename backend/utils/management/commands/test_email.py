@@ -19,6 +19,11 @@ class Command(BaseCommand):
             choices=['simple', 'order', 'all'],
             help='Type of test email to send'
         )
+        parser.add_argument(
+            '--persist',
+            action='store_true',
+            help='Attach the test order to a saved test_email_user account'
+        )
 
     def handle(self, *args, **options):
         email = options['email']
@@ -44,15 +49,24 @@ class Command(BaseCommand):
             from django.contrib.auth import get_user_model
             User = get_user_model()
             
-            # Create or get test user
-            test_user, _ = User.objects.get_or_create(
-                username='test_email_user',
-                defaults={
-                    'email': email,
-                    'first_name': 'Test',
-                    'last_name': 'User'
-                }
-            )
+            # The email service only reads attributes off the user, so an
+            # unsaved one avoids touching the database unless asked to
+            if options['persist']:
+                test_user, _ = User.objects.get_or_create(
+                    username='test_email_user',
+                    defaults={
+                        'email': email,
+                        'first_name': 'Test',
+                        'last_name': 'User'
+                    }
+                )
+            else:
+                test_user = User(
+                    username='test_email_user',
+                    email=email,
+                    first_name='Test',
+                    last_name='User'
+                )
             
             # Create test order
             test_order = Order(
@@ -3,19 +3,102 @@ Custom middleware for error handling, logging, and monitoring
 """
 import logging
 import time
-import json
-import uuid
-from django.utils.deprecation import MiddlewareMixin
-from django.http import JsonResponse
+import os
+from functools import lru_cache
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import HttpResponse, JsonResponse, QueryDict
 from django.conf import settings
 from django.core.cache import cache
 from django.utils.cache import get_cache_key
+from django.utils.functional import empty
 from rest_framework.response import Response
 
 logger = logging.getLogger(__name__)
 
 
-class RequestLoggingMiddleware(MiddlewareMixin):
+def _user_id(request):
+    """
+    Return the id of the authenticated user, or None
+    
+    Kept on the request once found, so the end and error log records don't
+    go through the lazy request.user again. An anonymous result is not kept:
+    token authentication only sets the user inside the view, after the
+    start record is logged.
+    """
+    try:
+        return request._log_user_id
+    except AttributeError:
+        pass
+    if hasattr(request, 'user') and request.user.is_authenticated:
+        request._log_user_id = request.user.id
+        return request._log_user_id
+    return None
+
+
+def _loaded_user_id(request):
+    """
+    Return the id of the authenticated user if request.user is already loaded
+    
+    request.user is a lazy object whose first use queries the session and
+    user tables, which Django refuses to do on the event loop. The async
+    paths use this instead and log no user until something has loaded it.
+    """
+    try:
+        return request._log_user_id
+    except AttributeError:
+        pass
+    user = getattr(request, 'user', None)
+    if user is None or getattr(user, '_wrapped', None) is empty:
+        return None
+    return _user_id(request)
+
+
+class HybridMiddleware:
+    """
+    Base class for middleware usable under both WSGI and ASGI.
+    
+    Unlike MiddlewareMixin, the async path runs the hooks on the event loop
+    instead of through sync_to_async, so process_request/process_response
+    must not block. Subclasses that do I/O override aprocess_request and
+    aprocess_response with async versions.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.process_request(request)
+        if response is None:
+            response = self.get_response(request)
+        return self.process_response(request, response)
+    
+    async def __acall__(self, request):
+        response = await self.aprocess_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return await self.aprocess_response(request, response)
+    
+    def process_request(self, request):
+        return None
+    
+    def process_response(self, request, response):
+        return response
+    
+    async def aprocess_request(self, request):
+        return self.process_request(request)
+    
+    async def aprocess_response(self, request, response):
+        return self.process_response(request, response)
+
+
+class RequestLoggingMiddleware(HybridMiddleware):
     """
     Middleware to log all incoming requests and responses with performance monitoring
     """
@@ -23,61 +106,68 @@ class RequestLoggingMiddleware(MiddlewareMixin):
     SLOW_REQUEST_THRESHOLD = 3.0  # seconds
     
     def process_request(self, request):
-        # Generate unique request ID
-        request.id = str(uuid.uuid4())
-        request.start_time = time.time()
-        
-        # Log request details
-        logger.info(
-            f"Request started: {request.id} - {request.method} {request.path}",
-            extra={
-                'request_id': request.id,
-                'method': request.method,
-                'path': request.path,
-                'user': request.user.id if hasattr(request, 'user') and request.user.is_authenticated else None,
-                'ip': self._get_client_ip(request),
-            }
-        )
-        
+        self._start_request(request, _user_id)
+        return None
+    
+    async def aprocess_request(self, request):
+        self._start_request(request, _loaded_user_id)
         return None
     
     def process_response(self, request, response):
-        # Calculate request duration
-        if hasattr(request, 'start_time'):
-            duration = time.time() - request.start_time
-        else:
-            duration = 0
+        return self._finish_request(request, response, _user_id)
+    
+    async def aprocess_response(self, request, response):
+        return self._finish_request(request, response, _loaded_user_id)
+    
+    def _start_request(self, request, get_user_id):
+        # Generate unique request ID; 96 random bits in hex is plenty for
+        # log correlation and skips building a UUID object
+        request.id = os.urandom(12).hex()
+        request.start_time = time.perf_counter()
         
-        # Log slow requests with warning
-        if duration > self.SLOW_REQUEST_THRESHOLD:
-            logger.warning(
-                f"Slow request detected: {getattr(request, 'id', 'unknown')} - "
-                f"{request.method} {request.path} - Status: {response.status_code} - "
-                f"Duration: {duration:.3f}s",
+        # Log request details; the user and client IP are only looked up
+        # when INFO is enabled
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                f"Request started: {request.id} - {request.method} {request.path}",
                 extra={
-                    'request_id': getattr(request, 'id', 'unknown'),
+                    'request_id': request.id,
                     'method': request.method,
                     'path': request.path,
-                    'status_code': response.status_code,
-                    'duration': duration,
-                    'user': request.user.id if hasattr(request, 'user') and request.user.is_authenticated else None,
+                    'user': get_user_id(request),
+                    'ip': self._get_client_ip(request),
                 }
             )
+    
+    def _finish_request(self, request, response, get_user_id):
+        # Calculate request duration
+        if hasattr(request, 'start_time'):
+            duration = time.perf_counter() - request.start_time
         else:
-            # Log normal response
-            logger.info(
-                f"Request completed: {getattr(request, 'id', 'unknown')} - "
-                f"{request.method} {request.path} - Status: {response.status_code} - "
-                f"Duration: {duration:.3f}s",
-                extra={
-                    'request_id': getattr(request, 'id', 'unknown'),
-                    'method': request.method,
-                    'path': request.path,
-                    'status_code': response.status_code,
-                    'duration': duration,
-                    'user': request.user.id if hasattr(request, 'user') and request.user.is_authenticated else None,
-                }
+            duration = 0
+        
+        slow = duration > self.SLOW_REQUEST_THRESHOLD
+        if slow or logger.isEnabledFor(logging.INFO):
+            request_id = getattr(request, 'id', 'unknown')
+            summary = (
+                f"{request_id} - {request.method} {request.path} - "
+                f"Status: {response.status_code} - Duration: {duration:.3f}s"
             )
+            extra = {
+                'request_id': request_id,
+                'method': request.method,
+                'path': request.path,
+                'status_code': response.status_code,
+                'duration': duration,
+                'user': get_user_id(request),
+            }
+            
+            # Log slow requests with warning
+            if slow:
+                logger.warning(f"Slow request detected: {summary}", extra=extra)
+            else:
+                # Log normal response
+                logger.info(f"Request completed: {summary}", extra=extra)
         
         # Add request ID and performance headers
         if hasattr(request, 'id'):
@@ -96,7 +186,7 @@ class RequestLoggingMiddleware(MiddlewareMixin):
                 'request_id': getattr(request, 'id', 'unknown'),
                 'method': request.method,
                 'path': request.path,
-                'user': request.user.id if hasattr(request, 'user') and request.user.is_authenticated else None,
+                'user': _user_id(request),
             }
         )
         
@@ -106,45 +196,57 @@ class RequestLoggingMiddleware(MiddlewareMixin):
         """Get client IP address from request"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+            # Only the leftmost hop is needed, so don't split out the rest
+            ip = x_forwarded_for.partition(',')[0].strip()
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
 
-class SecurityHeadersMiddleware(MiddlewareMixin):
+class SecurityHeadersMiddleware(HybridMiddleware):
     """
     Middleware to add security headers to all responses
     """
     
+    # Security headers added to every response
+    _STATIC_HEADERS = (
+        ('X-Content-Type-Options', 'nosniff'),
+        ('X-Frame-Options', 'DENY'),
+        ('X-XSS-Protection', '1; mode=block'),
+        ('Referrer-Policy', 'strict-origin-when-cross-origin'),
+    )
+    # CSP header for additional XSS protection, outside DEBUG
+    CONTENT_SECURITY_POLICY = (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://js.stripe.com https://www.google-analytics.com https://www.googletagmanager.com; "
+        "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
+        "font-src 'self' https://fonts.gstatic.com; "
+        "img-src 'self' data: https:; "
+        "connect-src 'self' https://api.stripe.com https://www.google-analytics.com https://analytics.google.com https://api.goshippo.com; "
+        "frame-src https://js.stripe.com https://hooks.stripe.com; "
+        "object-src 'none'; "
+        "base-uri 'self'; "
+        "form-action 'self'; "
+        "frame-ancestors 'none'; "
+        "upgrade-insecure-requests;"
+    )
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        # Settings are read once, when the middleware chain is built
+        self._headers = self._STATIC_HEADERS
+        if not settings.DEBUG:
+            self._headers += (('Content-Security-Policy', self.CONTENT_SECURITY_POLICY),)
+    
     def process_response(self, request, response):
         # Add security headers
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['X-Frame-Options'] = 'DENY'
-        response['X-XSS-Protection'] = '1; mode=block'
-        response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        
-        # Add CSP header for additional XSS protection
-        if not settings.DEBUG:
-            response['Content-Security-Policy'] = (
-                "default-src 'self'; "
-                "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://js.stripe.com https://www.google-analytics.com https://www.googletagmanager.com; "
-                "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
-                "font-src 'self' https://fonts.gstatic.com; "
-                "img-src 'self' data: https:; "
-                "connect-src 'self' https://api.stripe.com https://www.google-analytics.com https://analytics.google.com https://api.goshippo.com; "
-                "frame-src https://js.stripe.com https://hooks.stripe.com; "
-                "object-src 'none'; "
-                "base-uri 'self'; "
-                "form-action 'self'; "
-                "frame-ancestors 'none'; "
-                "upgrade-insecure-requests;"
-            )
+        for header, value in self._headers:
+            response[header] = value
         
         return response
 
 
-class ErrorHandlingMiddleware(MiddlewareMixin):
+class ErrorHandlingMiddleware(HybridMiddleware):
     """
     Middleware to handle unexpected errors gracefully
     """
@@ -173,81 +275,59 @@ class ErrorHandlingMiddleware(MiddlewareMixin):
         }, status=500)
 
 
-class PerformanceMonitoringMiddleware(MiddlewareMixin):
+@lru_cache(maxsize=4096)
+def _build_cache_key(method, path, query_string, user_id):
     """
-    Middleware to monitor performance and log slow requests
+    Build CacheMiddleware's key for a request
+    
+    Memoized on the raw query string, so a repeated URL skips parsing and
+    sorting its parameters; reordered parameters still share one key.
     """
+    key_parts = [
+        'api_cache',
+        method,
+        path,
+    ]
     
-    SLOW_REQUEST_THRESHOLD = 3.0  # seconds
+    # Add query parameters
+    query_params = QueryDict(query_string).dict()
+    if query_params:
+        sorted_params = sorted(query_params.items())
+        key_parts.append(str(sorted_params))
     
-    def process_request(self, request):
-        request._start_time = time.time()
-        return None
+    # Add user ID for personalized content
+    if user_id is not None:
+        key_parts.append(f'user_{user_id}')
     
-    def process_response(self, request, response):
-        if hasattr(request, '_start_time'):
-            duration = time.time() - request._start_time
-            
-            # Log slow requests
-            if duration > self.SLOW_REQUEST_THRESHOLD:
-                logger.warning(
-                    f"Slow request detected: {request.method} {request.path} - "
-                    f"Duration: {duration:.3f}s",
-                    extra={
-                        'request_id': getattr(request, 'id', 'unknown'),
-                        'method': request.method,
-                        'path': request.path,
-                        'duration': duration,
-                        'status_code': response.status_code,
-                    }
-                )
-        
-        return response
+    return ':'.join(key_parts)
 
 
-class CacheMiddleware(MiddlewareMixin):
+class CacheMiddleware(HybridMiddleware):
     """
     Middleware for API response caching
     """
     
-    CACHE_METHODS = ['GET', 'HEAD']
-    CACHE_PATHS = [
+    CACHE_TIMEOUT = 60  # 1 minute
+    CACHE_METHODS = frozenset({'GET', 'HEAD'})
+    # A tuple, so str.startswith() can test every prefix in one call
+    CACHE_PATHS = (
         '/api/products/',
         '/api/categories/',
         '/api/promotions/',
-    ]
+    )
     
     def should_cache(self, request):
         """Determine if request should be cached"""
-        if request.method not in self.CACHE_METHODS:
-            return False
-        
-        # Check if path should be cached
-        for path in self.CACHE_PATHS:
-            if request.path.startswith(path):
-                return True
-        
-        return False
+        return request.method in self.CACHE_METHODS and request.path.startswith(self.CACHE_PATHS)
     
     def get_cache_key(self, request):
         """Generate cache key for request"""
-        key_parts = [
-            'api_cache',
+        return _build_cache_key(
             request.method,
             request.path,
-        ]
-        
-        # Add query parameters
-        query_params = request.GET.dict()
-        if query_params:
-            sorted_params = sorted(query_params.items())
-            key_parts.append(str(sorted_params))
-        
-        # Add user ID for personalized content
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            key_parts.append(f'user_{request.user.id}')
-        
-        return ':'.join(key_parts)
+            request.META.get('QUERY_STRING', ''),
+            _user_id(request),
+        )
     
     def process_request(self, request):
         """Try to serve from cache"""
@@ -255,35 +335,67 @@ class CacheMiddleware(MiddlewareMixin):
             return None
         
         cache_key = self.get_cache_key(request)
-        cached_response = cache.get(cache_key)
+        return self._cache_hit(request, cache_key, cache.get(cache_key))
+    
+    async def aprocess_request(self, request):
+        if not self.should_cache(request):
+            return None
         
+        # The key includes the user, whose lazy lookup must run off the loop
+        cache_key = await sync_to_async(self.get_cache_key)(request)
+        return self._cache_hit(request, cache_key, await cache.aget(cache_key))
+    
+    def process_response(self, request, response):
+        """Cache successful responses"""
+        data = self._data_to_cache(request, response)
+        if data is not None:
+            try:
+                cache.set(request._cache_key, data, timeout=self.CACHE_TIMEOUT)
+            except Exception:
+                pass
+            else:
+                self._mark_cached(request, response)
+        return response
+    
+    async def aprocess_response(self, request, response):
+        data = self._data_to_cache(request, response)
+        if data is not None:
+            try:
+                await cache.aset(request._cache_key, data, timeout=self.CACHE_TIMEOUT)
+            except Exception:
+                pass
+            else:
+                self._mark_cached(request, response)
+        return response
+    
+    def _cache_hit(self, request, cache_key, cached_response):
         if cached_response:
-            logger.debug(f"Cache hit for {request.path}")
-            response = JsonResponse(cached_response)
-            response['X-Cache'] = 'HIT'
-            return response
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Cache hit for {request.path}")
+            if isinstance(cached_response, bytes):
+                return HttpResponse(cached_response, content_type='application/json', headers={'X-Cache': 'HIT'})
+            # Entry written before bodies were cached as bytes. They expire
+            # after CACHE_TIMEOUT, so this path is not worth a faster encoder
+            return JsonResponse(cached_response, safe=False, headers={'X-Cache': 'HIT'})
         
         # Store cache key for response processing
         request._cache_key = cache_key
         return None
     
-    def process_response(self, request, response):
-        """Cache successful responses"""
-        if hasattr(request, '_cache_key') and response.status_code == 200:
+    def _data_to_cache(self, request, response):
+        """
+        Return the body of a successful JSON response to cache, or None
+        
+        The rendered bytes are cached as-is and replayed on a hit, so the
+        body is neither parsed here nor re-serialized when served.
+        """
+        if hasattr(request, '_cache_key') and response.status_code == 200 and not response.streaming:
             # Only cache JSON responses
             if response.get('Content-Type', '').startswith('application/json'):
-                try:
-                    # Parse response content
-                    if hasattr(response, 'data'):
-                        data = response.data
-                    else:
-                        data = json.loads(response.content)
-                    
-                    # Cache the data
-                    cache.set(request._cache_key, data, timeout=60)  # 1 minute cache
-                    response['X-Cache'] = 'MISS'
-                    logger.debug(f"Cached response for {request.path}")
-                except:
-                    pass
-        
-        return response
\ No newline at end of file
+                return response.content
+        return None
+    
+    def _mark_cached(self, request, response):
+        response['X-Cache'] = 'MISS'
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Cached response for {request.path}")
\ No newline at end of file
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailqueue',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='emailqueue_pending_idx'),
+        ),
+    ]
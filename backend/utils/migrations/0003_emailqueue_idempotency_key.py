@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0002_emailqueue_pending_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailqueue',
+            name='idempotency_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:58
+
+from django.db import migrations, models
+import utils.email
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0003_emailqueue_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailqueue',
+            name='metadata',
+            field=models.JSONField(blank=True, decoder=utils.email.OrjsonDecoder, default=dict, encoder=utils.email.OrjsonEncoder),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.core.cache import cache
 from django.contrib.sessions.models import Session
 from django.utils import timezone
 from django.core.mail import send_mail
+from smtplib import SMTPException
 from django.conf import settings
 import logging
 
@@ -51,6 +52,62 @@ def send_async_email(subject, message, recipient_list, html_message=None):
         logger.error(f"Failed to send email: {str(e)}")
         return False
 
+@shared_task(
+    bind=True,
+    autoretry_for=(SMTPException, OSError),
+    retry_backoff=True,
+    retry_jitter=True,
+    max_retries=3
+)
+def send_email_task(self, to_email, subject, html_content, plain_content, from_email,
+                    queue_on_failure=True, metadata=None, idempotency_key=None):
+    """
+    Send a pre-rendered email from EmailService.send_email
+    
+    Transient SMTP and socket errors are retried by Celery with jittered
+    exponential backoff; once retries are exhausted the email is moved to
+    the EmailQueue table for process_email_queue to pick up.
+    """
+    from utils.email import email_service, release_email_idempotency_key
+    
+    email = email_service.build_message(
+        to_email=to_email,
+        subject=subject,
+        html_content=html_content,
+        plain_content=plain_content,
+        from_email=from_email
+    )
+    try:
+        email.send(fail_silently=False)
+    except (SMTPException, OSError) as e:
+        if self.request.retries < self.max_retries:
+            raise
+        logger.error(f"Failed to send email to {to_email} after {self.request.retries + 1} attempts: {e}")
+        if queue_on_failure:
+            email_service._queue_email(
+                to_email=to_email,
+                subject=subject,
+                html_content=html_content,
+                plain_content=plain_content,
+                from_email=from_email,
+                last_error=str(e),
+                metadata=metadata,
+                idempotency_key=idempotency_key
+            )
+        else:
+            release_email_idempotency_key(idempotency_key)
+        return False
+    
+    logger.info(f"Email sent successfully to {to_email}")
+    return True
+
+@shared_task
+def process_email_queue():
+    """Send emails waiting in the EmailQueue table"""
+    from utils.email import email_service
+    
+    email_service.process_email_queue()
+
 @shared_task
 def warm_cache():
     """Warm up cache with frequently accessed data"""
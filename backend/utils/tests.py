@@ -0,0 +1,252 @@
+import pickle
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone as django_timezone
+
+from orders.models import Order
+from utils import cache as cache_utils
+from utils.cache_serializers import MSGPackSerializer
+from utils.email import EMAIL_CLAIM_TIMEOUT, EmailQueue, email_service
+from utils.middleware import CacheMiddleware
+
+
+@override_settings(USE_REDIS_CACHE=True)
+@patch('utils.cache._ensure_writer_thread')
+class CacheWriteQueueTestCase(TestCase):
+    """Background cache writes against invalidation"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_invalidation_discards_queued_write(self, _):
+        """A write queued before invalidation must not land after it"""
+        cache_utils.set_cache_async('product:1', 'stale', 60)
+        cache_utils.set_cache_async('category_list', 'fresh', 60)
+        
+        cache_utils.invalidate_cache(['product:1'])
+        cache_utils._flush_pending_writes()
+        
+        self.assertIsNone(cache.get('product:1'))
+        self.assertEqual(cache.get('category_list'), 'fresh')
+    
+    def test_wildcard_invalidation_discards_queued_writes(self, _):
+        cache_utils.set_cache_async('product_list:abc', 'stale', 60)
+        cache_utils.set_cache_async('product:2', 'fresh', 60)
+        
+        cache_utils.invalidate_cache(['product_list:*'])
+        cache_utils._flush_pending_writes()
+        
+        self.assertIsNone(cache.get('product_list:abc'))
+        self.assertEqual(cache.get('product:2'), 'fresh')
+
+
+
+class InvalidateOnCommitTestCase(TestCase):
+    """Product invalidations queued within a transaction"""
+    
+    def setUp(self):
+        cache.clear()
+        cache.set('product:1', 'cached')
+        cache.set('product:2', 'cached')
+    
+    @patch('utils.cache.invalidate_cache', wraps=cache_utils.invalidate_cache)
+    def test_one_invalidation_per_transaction(self, mock_invalidate):
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_utils.invalidate_product_cache(product_id=1)
+            cache_utils.invalidate_product_cache(product_id=2)
+            self.assertEqual(cache.get('product:1'), 'cached')
+        
+        mock_invalidate.assert_called_once()
+        patterns = mock_invalidate.call_args[0][0]
+        self.assertIn('product:1', patterns)
+        self.assertIn('product:2', patterns)
+        self.assertIsNone(cache.get('product:1'))
+        self.assertIsNone(cache.get('product:2'))
+    
+    @patch('utils.cache.invalidate_cache', wraps=cache_utils.invalidate_cache)
+    def test_invalidates_after_rolled_back_transaction(self, mock_invalidate):
+        try:
+            with transaction.atomic():
+                cache_utils.invalidate_product_cache(product_id=1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_utils.invalidate_product_cache(product_id=2)
+        
+        mock_invalidate.assert_called_once()
+        self.assertIsNone(cache.get('product:2'))
+
+class MSGPackSerializerTestCase(TestCase):
+    def setUp(self):
+        self.serializer = MSGPackSerializer({})
+    
+    def test_round_trip(self):
+        value = {
+            'id': 1,
+            'name': 'Dragon',
+            'price': Decimal('12.50'),
+            'created_at': datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            'release_date': date(2026, 1, 2),
+            'uuid': uuid.uuid4(),
+            'tags': ['pla', 'articulated'],
+            'thumbnail': b'\x89PNG',
+            'discount': None,
+        }
+        
+        self.assertEqual(self.serializer.loads(self.serializer.dumps(value)), value)
+    
+    def test_reads_pickled_values(self):
+        """Entries written with the old pickle serializer stay readable"""
+        value = {'price': Decimal('30.00'), 'in_stock': True}
+        
+        self.assertEqual(self.serializer.loads(pickle.dumps(value)), value)
+
+
+class EmailQueueTestCase(TestCase):
+    """Claiming and sending rows from the EmailQueue sweep"""
+    
+    def queue_email(self, **kwargs):
+        return EmailQueue.objects.create(
+            to_email='guest@example.com',
+            subject='Queued',
+            html_content='<p>Queued</p>',
+            plain_content='Queued',
+            **kwargs
+        )
+    
+    def test_sweep_sends_pending_emails(self):
+        queued = [self.queue_email(), self.queue_email()]
+        
+        email_service.process_email_queue()
+        
+        self.assertEqual(len(mail.outbox), 2)
+        for item in queued:
+            item.refresh_from_db()
+            self.assertEqual(item.status, 'sent')
+            self.assertEqual(item.attempts, 1)
+    
+    def test_sweep_skips_claimed_emails_until_abandoned(self):
+        item = self.queue_email(status='processing', claimed_at=django_timezone.now())
+        
+        email_service.process_email_queue()
+        self.assertEqual(len(mail.outbox), 0)
+        
+        item.claimed_at = django_timezone.now() - timedelta(seconds=EMAIL_CLAIM_TIMEOUT + 1)
+        item.save(update_fields=['claimed_at'])
+        
+        email_service.process_email_queue()
+        self.assertEqual(len(mail.outbox), 1)
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'sent')
+    
+    @patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('refused'))
+    def test_failed_send_releases_claim(self, mock_send):
+        item = self.queue_email()
+        
+        email_service.process_email_queue()
+        
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'pending')
+        self.assertEqual(item.attempts, 1)
+        self.assertEqual(item.last_error, 'refused')
+    
+    @patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('unreachable'))
+    def test_connection_failure_hands_batch_back(self, mock_open):
+        item = self.queue_email()
+        
+        email_service.process_email_queue()
+        
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'pending')
+        self.assertEqual(item.attempts, 0)
+
+    
+    def test_render_failure_is_recorded_but_never_sent(self):
+        self.assertFalse(email_service.send_email(
+            to_email='guest@example.com',
+            subject='Broken',
+            template_name='does_not_exist',
+            context={}
+        ))
+        
+        item = EmailQueue.objects.get(subject='Broken')
+        self.assertEqual(item.status, 'failed')
+        self.assertIn('does_not_exist', item.last_error)
+        
+        email_service.process_email_queue()
+        self.assertEqual(len(mail.outbox), 0)
+
+class OrderEmailDeduplicationTestCase(TestCase):
+    """Order emails sent with a per-event idempotency key"""
+    
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create(
+            order_number='EMAIL123',
+            status='processing',
+            subtotal=Decimal('20.00'),
+            total_amount=Decimal('20.00'),
+            shipping_name='Guest Buyer',
+            shipping_email='guest@example.com',
+            shipping_address='1 Main St',
+            shipping_city='Springfield',
+            shipping_state='IL',
+            shipping_postal_code='62701',
+            shipping_country='US',
+            billing_name='Guest Buyer',
+            billing_email='guest@example.com',
+            billing_address='1 Main St',
+            billing_city='Springfield',
+            billing_state='IL',
+            billing_postal_code='62701',
+            billing_country='US'
+        )
+    
+    def test_repeated_order_event_is_sent_once(self):
+        self.assertTrue(email_service.send_order_confirmation(self.order))
+        self.assertTrue(email_service.send_order_confirmation(self.order))
+        
+        self.assertEqual(len(mail.outbox), 1)
+    
+    def test_emails_without_idempotency_key_are_always_sent(self):
+        email_service.send_order_status_update(self.order, 'pending')
+        email_service.send_order_status_update(self.order, 'pending')
+        
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class CacheMiddlewareTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.body = b'{"results":[{"id":1,"price":"12.50"}]}'
+        self.get_response = Mock(
+            return_value=HttpResponse(self.body, content_type='application/json')
+        )
+        self.middleware = CacheMiddleware(self.get_response)
+    
+    def get(self):
+        request = self.factory.get('/api/products/', {'page': '1'})
+        request.user = AnonymousUser()
+        return self.middleware(request)
+    
+    def test_replays_cached_bytes(self):
+        first = self.get()
+        second = self.get()
+        
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, self.body)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.get_response.assert_called_once()